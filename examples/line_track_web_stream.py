@@ -177,6 +177,7 @@ def signal_handler(sig, frame):
 if __name__ == '__main__':
     signal.signal(signal.SIGINT, signal_handler)
     fc.start_speed_thread()
+    fc.start_sampler()
 
     Thread(target=camera_loop, daemon=True).start()
     Thread(target=track_line_loop, daemon=True).start()
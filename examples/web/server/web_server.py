@@ -9,6 +9,7 @@ import json
 import time
 
 fc.start_speed_thread()
+fc.start_sampler()
 speed_count = 0
 gs_list = []
 
@@ -1,65 +1,256 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from .pwm import PWM
-from .adc import ADC
 from .pin import Pin
-from .motor import Motor
-from .speed import Speed
+from .motor import Motor, arcade_mix, set_power_frame
 from .filedb import FileDB  
 from .utils import *
+import importlib
+import threading
 import time
 from .version import __version__
 
-soft_reset()
-time.sleep(0.2)
+# Importing the package touches no hardware: the config, motors, encoders
+# and sensors below are set up on first use, or up front with init().
 
-# Config File:
-config = FileDB("config")
-left_front_reverse = config.get('left_front_reverse', default_value = False)
-right_front_reverse = config.get('right_front_reverse', default_value = False)
-left_rear_reverse = config.get('left_rear_reverse', default_value = False)
-right_rear_reverse = config.get('right_rear_reverse', default_value = False)
+# Imported on first use, so NumPy only loads when something needs it
+_LAZY_IMPORTS = {
+    "ADC": ".adc",
+    "ADCGroup": ".adc",
+    "Speed": ".speed",
+    "encoders": ".speed",
+    "Sampler": ".sampler",
+    "FilterChain": ".filters",
+    "RejectOutliers": ".filters",
+    "Oversample": ".filters",
+    "Median": ".filters",
+    "EMA": ".filters",
+    "Odometry": ".odometry",
+    "SpeedController": ".control",
+    "RampScheduler": ".ramp",
+}
 
-# Init motors
-left_front = Motor(PWM("P13"), Pin("D4"), is_reversed=left_front_reverse) # motor 1
-right_front = Motor(PWM("P12"), Pin("D5"), is_reversed=right_front_reverse) # motor 2
-left_rear = Motor(PWM("P8"), Pin("D11"), is_reversed=left_rear_reverse) # motor 3
-right_rear = Motor(PWM("P9"), Pin("D15"), is_reversed=right_rear_reverse) # motor 4
+_init_lock = threading.RLock()
+_initialized = set()
+_mcu_reset = False
 
-# left_front_speed = Speed(12)
-# right_front_speed = Speed(16)
-left_rear_speed = Speed(25)
-right_rear_speed = Speed(4)  
+def _reset_mcu():
+    global _mcu_reset
+    if not _mcu_reset:
+        soft_reset()
+        time.sleep(0.2)
+        _mcu_reset = True
 
-# Init Greyscale
-gs0 = ADC('A5')
-gs1 = ADC('A6')
-gs2 = ADC('A7')
+def _init_config():
+    global config, config_values
+    # Config File, read once:
+    config = FileDB("config")
+    config_values = config.read()
+
+def _init_motors():
+    global left_front, right_front, left_rear, right_rear, ramp_scheduler
+    from .ramp import RampScheduler
+    init("config")
+    _reset_mcu()
+    left_front_reverse = config_values.get('left_front_reverse', False)
+    right_front_reverse = config_values.get('right_front_reverse', False)
+    left_rear_reverse = config_values.get('left_rear_reverse', False)
+    right_rear_reverse = config_values.get('right_rear_reverse', False)
+
+    # Init motors
+    left_front = Motor(PWM("P13"), Pin("D4"), is_reversed=left_front_reverse) # motor 1
+    right_front = Motor(PWM("P12"), Pin("D5"), is_reversed=right_front_reverse) # motor 2
+    left_rear = Motor(PWM("P8"), Pin("D11"), is_reversed=left_rear_reverse) # motor 3
+    right_rear = Motor(PWM("P9"), Pin("D15"), is_reversed=right_rear_reverse) # motor 4
+
+    # Acceleration limited power ramps for all four motors, see ramp_frame()
+    ramp_scheduler = RampScheduler(
+        (left_front, right_front, left_rear, right_rear),
+        lambda powers: drive_frame(*powers))
+    # Sleeps until a ramp is set, so ramp_frame() never starts a thread.
+    ramp_scheduler.start()
+
+def _init_encoders():
+    global left_rear_speed, right_rear_speed, odometry, speed_controller
+    from .speed import Speed
+    from .odometry import Odometry
+    from .control import SpeedController
+    # left_front_speed = Speed(12)
+    # right_front_speed = Speed(16)
+    left_rear_speed = Speed(25)
+    right_rear_speed = Speed(4)
+    # Pose from the rear encoders, see start_odometry()
+    odometry = Odometry(left_rear_speed, right_rear_speed)
+    if "motors" in _initialized:
+        odometry.command(left_front._power + left_rear._power, right_front._power + right_rear._power)
+    # Closed loop speed control for left front, right front, left rear and
+    # right rear; the front wheels use the rear encoder on their side.
+    speed_controller = SpeedController(
+        (left_rear_speed, right_rear_speed, left_rear_speed, right_rear_speed),
+        lambda powers: drive_frame(*powers))
+
+def _init_sensors():
+    global gs0, gs1, gs2, grayscale, battery, sensors
+    from .adc import ADC, ADCGroup
+    from .sampler import Sampler
+    _reset_mcu()
+    # Init Greyscale
+    gs0 = ADC.get('A5')
+    gs1 = ADC.get('A6')
+    gs2 = ADC.get('A7')
+    grayscale = ADCGroup([gs0, gs1, gs2])
+    battery = ADC.get('A4', caller="battery")
+
+    # Background sampler for the grayscale (columns 0-2) and battery
+    # (column 3) channels, see start_sampler().
+    sensors = Sampler(ADCGroup([gs0, gs1, gs2, battery]))
+
+_PARTS = {
+    "config": _init_config,
+    "motors": _init_motors,
+    "encoders": _init_encoders,
+    "sensors": _init_sensors,
+}
+
+# Module attributes and the part that creates them
+_HARDWARE = {
+    "config": "config",
+    "config_values": "config",
+    "left_front": "motors",
+    "right_front": "motors",
+    "left_rear": "motors",
+    "right_rear": "motors",
+    "ramp_scheduler": "motors",
+    "left_rear_speed": "encoders",
+    "right_rear_speed": "encoders",
+    "odometry": "encoders",
+    "speed_controller": "encoders",
+    "gs0": "sensors",
+    "gs1": "sensors",
+    "gs2": "sensors",
+    "grayscale": "sensors",
+    "battery": "sensors",
+    "sensors": "sensors",
+}
+
+def init(*parts):
+    """Set up the hardware now instead of on first use.
+
+    ``parts`` are any of "config", "motors", "encoders" and "sensors", all
+    of them by default.  Parts already set up are skipped, so it is cheap
+    to call again.
+    """
+    for part in parts or _PARTS:
+        if part in _initialized:
+            continue
+        with _init_lock:
+            if part not in _initialized:
+                _PARTS[part]()
+                _initialized.add(part)
+
+def __getattr__(name):
+    if name in _HARDWARE:
+        init(_HARDWARE[name])
+        return globals()[name]
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Oldest sample, in sampler periods, that readers accept before reading
+# the bus themselves.
+SAMPLE_MAX_AGE = 3
+# FilterChain applied to the sampled grayscale values, see
+# set_grayscale_filter().
+grayscale_filter = None
 
 
 def start_speed_thread():
+    init("encoders")
     # left_front_speed.start()
     # right_front_speed.start()
     left_rear_speed.start()
     right_rear_speed.start()
 
+def stop_speed_thread():
+    from .speed import encoders
+    encoders.deinit()
+
+def start_odometry(rate=50, record=False):
+    """Integrate the pose from the wheel encoders; starts them too."""
+    start_speed_thread()
+    odometry.recording = record
+    odometry.start(rate)
+
+def stop_odometry():
+    if "encoders" in _initialized:
+        odometry.deinit()
+
+def set_speed(left, right=None):
+    """Hold the left and right wheels at a speed in cm/s (negative for
+    backwards) with the speed controller, starting it and the encoders if
+    needed.  The power commands, stop() included, end speed control."""
+    if right is None:
+        right = left
+    _cancel_ramp()
+    init("encoders")
+    speed_controller.set_target((left, right, left, right))
+    if not speed_controller.running:
+        start_speed_thread()
+        speed_controller.start()
+
+def stop_speed_control():
+    if "encoders" in _initialized:
+        speed_controller.deinit()
+
+def speed_list():
+    """Speed of every started wheel encoder in cm/s."""
+    from .speed import encoders
+    return encoders.speeds()
+
+def start_sampler(rate=100):
+    init("sensors")
+    sensors.start(rate)
+
+def sampler_running():
+    """True if the background sampler is running, see start_sampler()."""
+    return "sensors" in _initialized and sensors.running
+
+def stop_sampler():
+    if "sensors" in _initialized:
+        sensors.deinit()
+
+def set_grayscale_filter(chain):
+    """Filter grayscale readings with ``chain`` (a FilterChain) while the
+    sampler runs, e.g. FilterChain(RejectOutliers(), Median(5)).  None
+    turns filtering off."""
+    global grayscale_filter
+    grayscale_filter = chain
+
 ##################################################################
 # Grayscale 
 def get_grayscale_list():
-    adc_value_list = []
-    adc_value_list.append(gs0.read())
-    adc_value_list.append(gs1.read())
-    adc_value_list.append(gs2.read())
-    return adc_value_list
+    init("sensors")
+    if sensors.running:
+        max_age = SAMPLE_MAX_AGE / sensors.rate
+        if grayscale_filter is not None:
+            return grayscale_filter.read(sensors, max_age)[1][:3].tolist()
+        return sensors.latest(max_age)[1][:3].tolist()
+    return grayscale.read_list()
 
-def is_on_edge(ref, gs_list):
+def is_on_edge(ref, gs_list=None):
+    if gs_list is None:
+        gs_list = get_grayscale_list()
     ref = int(ref)
     if gs_list[2] <= ref or gs_list[1] <= ref or gs_list[0] <= ref:  
         return True
     else:
         return False
 
-def get_line_status(ref,fl_list):#170<x<300
+def get_line_status(ref,fl_list=None):#170<x<300
+    if fl_list is None:
+        fl_list = get_grayscale_list()
     ref = int(ref)
     if fl_list[1] <= ref:
         return 0
@@ -72,37 +263,79 @@ def get_line_status(ref,fl_list):#170<x<300
 
 ########################################################
 # Motors
+def drive_frame(left_front_power, right_front_power, left_rear_power, right_rear_power):
+    init("motors")
+    if "encoders" in _initialized:
+        odometry.command(left_front_power + left_rear_power, right_front_power + right_rear_power)
+    set_power_frame(
+        (left_front, right_front, left_rear, right_rear),
+        (left_front_power, right_front_power, left_rear_power, right_rear_power))
+
+def _cancel_ramp():
+    # A direct power command replaces whatever the ramp was heading for,
+    # otherwise the next ramp tick would overwrite it.
+    if "motors" in _initialized:
+        ramp_scheduler.cancel()
+
+def _cancel_speed_control():
+    # Same for the speed controller, which commits on every tick
+    if "encoders" in _initialized and speed_controller.running:
+        speed_controller.cancel()
+
+def _direct_command():
+    _cancel_speed_control()
+    _cancel_ramp()
+
+def tank(left_power, right_power):
+    """Drive the left and right side wheels at a power each, -100 to 100,
+    in one batched update."""
+    _direct_command()
+    left_power = max(-100, min(100, left_power))
+    right_power = max(-100, min(100, right_power))
+    drive_frame(left_power, right_power, left_power, right_power)
+
+def drive(throttle, steer=0):
+    """Drive with a ``throttle`` (negative backwards) and a ``steer``
+    (positive turns right), both -100 to 100, in one batched update.  Cheap
+    enough to call on every tick of a control loop."""
+    tank(*arcade_mix(throttle, steer))
+
+def ramp_frame(left_front_power, right_front_power, left_rear_power, right_rear_power, accel=None):
+    """Ramp the motors to these powers at most ``accel`` power per second
+    (default RampScheduler accel) and return straight away.  The direct
+    power commands, stop() included, cancel the ramp."""
+    _cancel_speed_control()
+    init("motors")
+    ramp_scheduler.set_target(
+        (left_front_power, right_front_power, left_rear_power, right_rear_power), accel)
+
+def stop_ramp():
+    if "motors" in _initialized:
+        ramp_scheduler.cancel()
+
 def forward(power):
-    left_front.set_power(power)
-    left_rear.set_power(power)
-    right_front.set_power(power)
-    right_rear.set_power(power)
+    _direct_command()
+    drive_frame(power, power, power, power)
 
 def backward(power):
-    left_front.set_power(-power)
-    left_rear.set_power(-power)
-    right_front.set_power(-power)
-    right_rear.set_power(-power)
+    _direct_command()
+    drive_frame(-power, -power, -power, -power)
 
 def turn_left(power):
-    left_front.set_power(-power)
-    left_rear.set_power(-power)
-    right_front.set_power(power)
-    right_rear.set_power(power)
+    _direct_command()
+    drive_frame(-power, power, -power, power)
 
 def turn_right(power):
-    left_front.set_power(power)
-    left_rear.set_power(power)
-    right_front.set_power(-power)
-    right_rear.set_power(-power)
+    _direct_command()
+    drive_frame(power, -power, power, -power)
 
 def stop():
-    left_front.set_power(0)
-    left_rear.set_power(0)
-    right_front.set_power(0)
-    right_rear.set_power(0)
+    _direct_command()
+    drive_frame(0, 0, 0, 0)
 
 def set_motor_power(motor, power):
+    init("motors")
+    _direct_command()
     if motor == 1:
         left_front.set_power(power)
     elif motor == 2:
@@ -125,6 +358,7 @@ def set_motor_power(motor, power):
 #         return right_rear_speed()
 
 def speed_val():
+    init("encoders")
     return (left_rear_speed() + right_rear_speed()) / 2.0
 
 ######################################################## 
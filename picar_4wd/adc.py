@@ -1,14 +1,23 @@
 #!/usr/bin/env python3
+import threading
+import time
+import numpy as np
 from .i2c import I2C
 
 class ADC(I2C):
     # Default I2C address of the SunFounder ADC module. Older boards
-    # use 0x14 while newer revisions may respond on 0x15.  When the
-    # default address fails we fall back to 0x15 automatically.
+    # use 0x14 while newer revisions may respond on 0x15, see
+    # SharedBus.mcu_address.
     ADDR = 0x14
+    # Last value read successfully, e.g. for use as a fallback:
+    #   adc.set_fallback(lambda exc: adc.last_value)
+    last_value = None
+    # Shared instances by channel number and caller, see ADC.get
+    _channels = {}
+    _channels_lock = threading.Lock()
 
-    def __init__(self, chn):    # adc channel:"A0, A1, A2, A3, A4, A5, A6, A7"
-        super().__init__()
+    def __init__(self, chn, caller=None):    # adc channel:"A0, A1, A2, A3, A4, A5, A6, A7"
+        super().__init__(caller=caller)
         if isinstance(chn, str):
             if chn.startswith("A"):     
                 chn = int(chn[1:])
@@ -19,31 +28,94 @@ class ADC(I2C):
         chn = 7 - chn
         self.chn = chn | 0x10          
         self.reg = 0x40 + self.chn
-        # Attempt to communicate using the default address.  If it fails
-        # with an I/O error, try the alternative address (0x15).
-        try:
-            self.send([self.chn, 0, 0], self.ADDR)
-            self.recv(1, self.ADDR)
-        except OSError as e:
-            print(f"I/O error in ADC.__init__: {e}, switching to 0x15")
-            self.ADDR = 0x15
+        self.ADDR = self._shared.mcu_address() or self.ADDR
         
-    def read(self):                     
-        self.send([self.chn, 0, 0], self.ADDR)
+    @classmethod
+    def get(cls, chn, caller=None):
+        """Shared ADC for ``chn`` and ``caller``, created on first use.
 
-        # self._debug("Read from 0x%02X"%(self.ADDR))
-        # value_h = self.bus.read_byte(self.ADDR)
-        value_h = self.recv(1, self.ADDR)[0]            
+        Use this instead of the constructor for channels read from several
+        places, so the bus setup is done once per caller.  Each caller gets
+        its own instance, so its reads stay attributed to it in the lock
+        stats and the bus trace.
+        """
+        key = (int(chn[1:]) if isinstance(chn, str) and chn.startswith("A") else chn, caller)
+        with cls._channels_lock:
+            adc = cls._channels.get(key)
+            if adc is None:
+                adc = cls._channels[key] = cls(chn, caller=caller)
+            return adc
 
-        # self._debug("Read from 0x%02X"%(self.ADDR))
-        # value_l = self.bus.read_byte(self.ADDR)
-        value_l = self.recv(1, self.ADDR)[0]           
+    @I2C.auto_reset
+    def _read_group(self, adcs):
+        timestamp = time.monotonic()
+        values = np.empty(len(adcs), dtype=np.uint16)
+        for i, adc in enumerate(adcs):
+            self.send([adc.chn, 0, 0], self.ADDR)
+            value_h = self._i2c_read_byte(self.ADDR)
+            value_l = self._i2c_read_byte(self.ADDR)
+            values[i] = (value_h << 8) + value_l
+        return timestamp, values
 
-        value = (value_h << 8) + value_l
+    def read(self):                     
+        # The channel select write and both byte reads must not interleave
+        # with another thread talking to the MCU, so run them as one
+        # transaction.
+        try:
+            value_h, value_l = self.transaction([
+                ("send", [self.chn, 0, 0]),
+                ("recv", 1),
+                ("recv", 1),
+            ], self.ADDR)
+        except OSError as e:
+            return self._fail(e)
+        value = (value_h[0] << 8) + value_l[0]
         # self._debug("Read value: %s"%value)
+        self.last_value = value
         return value
 
 
+class ADCGroup(object):
+    """Several ADC channels sampled together.
+
+    ``read`` selects and reads every channel inside one bus transaction, so
+    no other thread can get between them and the samples are taken back to
+    back.  The MCU still needs a select write and two byte reads per
+    channel; what is saved is the lock handoff and scheduling gaps between
+    channels.
+    """
+
+    def __init__(self, adcs):
+        self.adcs = [adc if isinstance(adc, ADC) else ADC(adc) for adc in adcs]
+        self.fallback = None
+        self.last_value = None
+        self.last_time = None
+
+    def __len__(self):
+        return len(self.adcs)
+
+    def set_fallback(self, handler):
+        """Return ``handler(exc)`` from ``read`` instead of raising."""
+        self.fallback = handler
+
+    def read(self):
+        """``(timestamp, values)``: a ``time.monotonic`` timestamp and a
+        uint16 NumPy array with one value per channel."""
+        try:
+            timestamp, values = self.adcs[0]._read_group(self.adcs)
+        except OSError as e:
+            if self.fallback is None:
+                raise
+            return self.fallback(e)
+        self.last_time = timestamp
+        self.last_value = values
+        return timestamp, values
+
+    def read_list(self):
+        """Values of ``read`` as a plain list of ints."""
+        return self.read()[1].tolist()
+
+
 def test():
     import time
     adc = ADC(0)
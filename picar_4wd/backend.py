@@ -0,0 +1,18 @@
+"""Hardware backend selection.
+
+Every module gets ``SMBus`` and ``GPIO`` from here instead of importing
+``smbus2`` and ``RPi.GPIO`` directly.  Set ``PICAR_4WD_BACKEND=sim`` before
+importing ``picar_4wd`` to run against the simulated HAT in ``sim.py``
+instead of real hardware.
+"""
+import os
+
+BACKEND = os.environ.get("PICAR_4WD_BACKEND", "hw")
+
+if BACKEND == "sim":
+    from .sim import SMBus, GPIO
+elif BACKEND == "hw":
+    from smbus2 import SMBus
+    import RPi.GPIO as GPIO
+else:
+    raise ValueError("PICAR_4WD_BACKEND should be 'hw' or 'sim', not {0}".format(BACKEND))
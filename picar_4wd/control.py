@@ -0,0 +1,85 @@
+import threading
+import numpy as np
+from .periodic import Periodic
+
+
+class SpeedController(Periodic):
+    """Closed loop wheel speed control.
+
+    A PI controller with feed-forward per wheel, run for all wheels at once
+    at ``rate`` Hz on one thread.  Targets are in cm/s; a negative target
+    drives the wheel backwards.  ``encoders`` gives the speed feedback for
+    each wheel (wheels without their own encoder can share one), and
+    ``commit(powers)`` writes the resulting motor powers, -100 to 100, in
+    one batch.
+
+    The integral only grows while the output is not saturated in the same
+    direction (anti-windup), and the output changes by at most ``SLEW``
+    power per second.
+    """
+    KF = 1.5        # feed-forward power per cm/s
+    KP = 1.0        # power per cm/s of error
+    KI = 2.0        # power per cm of accumulated error
+    SLEW = 200.0    # power per second
+    MAX_POWER = 100.0
+
+    def __init__(self, encoders, commit, rate=50, kf=None, kp=None, ki=None, slew=None):
+        super().__init__(rate)
+        self.encoders = encoders
+        self.commit = commit
+        if kf is not None:
+            self.KF = kf
+        if kp is not None:
+            self.KP = kp
+        if ki is not None:
+            self.KI = ki
+        if slew is not None:
+            self.SLEW = slew
+        count = len(encoders)
+        self.target = np.zeros(count)
+        self.output = np.zeros(count)
+        self.integral = np.zeros(count)
+        self._lock = threading.Lock()
+
+    def set_target(self, speeds):
+        """Target speed of each wheel in cm/s, in the order of ``encoders``."""
+        with self._lock:
+            self.target[:] = speeds
+
+    def step(self, dt):
+        """One control update over ``dt`` seconds; returns the powers."""
+        measured = np.array([encoder() for encoder in self.encoders], dtype=np.float64)
+        with self._lock:
+            target = self.target.copy()
+        # The encoders only see how fast a wheel turns, so control the
+        # magnitude and apply the direction of the target afterwards.
+        goal = np.abs(target)
+        error = goal - measured
+        out = self.KF * goal + self.KP * error + self.integral
+        saturated = ((out >= self.MAX_POWER) & (error > 0)) | ((out <= 0) & (error < 0))
+        self.integral = np.where(saturated, self.integral, self.integral + self.KI * error * dt)
+        out = np.clip(self.KF * goal + self.KP * error + self.integral, 0, self.MAX_POWER)
+        power = np.sign(target) * out
+        step = self.SLEW * dt
+        power = np.clip(power, self.output - step, self.output + step)
+        stopped = target == 0
+        power[stopped] = 0
+        self.integral[stopped] = 0
+        self.output = power
+        self.commit(power.round().astype(int).tolist())
+        return power
+
+    def cancel(self):
+        """Stop controlling and leave the motors at their last power."""
+        super().deinit()
+        with self._lock:
+            self.target[:] = 0
+        self.output[:] = 0
+        self.integral[:] = 0
+
+    def deinit(self):
+        self.cancel()
+        self.commit([0] * len(self.encoders))
+
+    def _tick(self, now, dt):
+        self.step(dt)
@@ -1,14 +1,23 @@
+import ast
+import copy
+import os
+import tempfile
+import threading
+from .utils import home_user
+
 class FileDB(object):
 	"""A file based database.
 
     A file based database, read and write arguements in the specific file.
+    The file is parsed once into memory and only read again when its
+    modification time or size changes.
     """
 	import os
 
 	# user_name = os.getlogin()
 	# user_name = os.popen("echo ${SUDO_USER:-$(who -m | awk '{ print $1 }')}").readline().strip()
 	# user_name = os.popen("getent passwd ${SUDO_UID:-$(id -u)} | cut -d: -f 6").readline().strip().split('/')[2]
-	user_name = os.popen("ls /home | head -n 1").readline().strip()
+	user_name = home_user()
 
 
 
@@ -21,57 +30,136 @@ class FileDB(object):
 			self.db = db
 		else:
 			self.db = "config"
+		self._lines = []		# raw lines, written back unchanged
+		self._index = {}		# name -> line number
+		self._values = {}		# name -> parsed value
+		self._stamp = None		# (mtime, size) of the file last parsed
+		self._error = None
+		self._lock = threading.RLock()
+
+	@property
+	def path(self):
+		return self.DIR + self.db
+
+	@staticmethod
+	def parse(value):
+		"""Python literal in a value, e.g. True, 1.5 or [1, 2]."""
+		return ast.literal_eval(value.strip())
+
+	def _load(self):
+		"""Parse the file again if it changed since the last time."""
+		try:
+			st = os.stat(self.path)
+		except OSError as e:
+			if self._error is None or self._stamp is not None:
+				print('error: %s'%e)
+			self._error = e
+			self._stamp = None
+			self._lines, self._index, self._values = [], {}, {}
+			return
+		stamp = (st.st_mtime_ns, st.st_size)
+		if stamp == self._stamp:
+			return
+		try:
+			with open(self.path, 'r') as conf:
+				lines = conf.readlines()
+		except OSError as e:
+			print('error: %s'%e)
+			self._error = e
+			return
+		self._error = None
+		self._stamp = stamp
+		self._index_lines(lines)
+
+	def _index_lines(self, lines):
+		index = {}
+		values = {}
+		for i, line in enumerate(lines):
+			if line.startswith('#') or '=' not in line:
+				continue
+			name, value = line.split('=', 1)
+			name = name.strip()
+			if name in index:
+				continue
+			index[name] = i
+			try:
+				values[name] = self.parse(value)
+			except (ValueError, SyntaxError):
+				pass
+		self._lines, self._index, self._values = lines, index, values
+
+	def read(self):
+		"""All values in the file as a dict."""
+		with self._lock:
+			self._load()
+			return copy.deepcopy(self._values)
 
 	def get(self, name, default_value=None):
 		"""Get value by data's name. Default value is for the arguemants do not exist"""
-		try:
-			conf = open(self.DIR+self.db,'r')
-			lines=conf.readlines()
-			conf.close()
-			flag = False
-			# Find the arguement and set the value
-			for line in lines:
-				# print(line)
-				if line.startswith('#'):
-					continue
-				# print("no#")
-				if line.split('=')[0].strip() == name:
-					# print(name)
-					value = line.split('=')[1].replace(' ', '').strip()
-					break
-			else:
-				# print("flag_error")
-				return default_value
+		with self._lock:
+			self._load()
+			# Copies, so changing a returned list does not change the cache
+			return copy.deepcopy(self._values.get(name, default_value))
 
-			return eval(value)
+	def get_many(self, names, default_value=None):
+		"""Values of several names as a dict.  ``names`` can also be a dict
+		of names and their own default values."""
+		with self._lock:
+			self._load()
+			if isinstance(names, dict):
+				values = {name: self._values.get(name, default) for name, default in names.items()}
+			else:
+				values = {name: self._values.get(name, default_value) for name in names}
+			return copy.deepcopy(values)
 
-		except Exception as e:
-			print('error: %s'%e)
-			return default_value
-	
 	def set(self, name, value):
 		"""Set value by data's name. Or create one if the arguement does not exist"""
+		self.set_many({name: value})
 
-		# Read the file
-		conf = open(self.DIR+self.db,'r')
-		lines=conf.readlines()
-		conf.close()
-		flag = False
-		# Find the arguement and set the value
-		for i, line in enumerate(lines):
-			if line.startswith('#'):
-				continue
-			if line.split('=')[0].strip() == name:
-				lines[i] = '%s = %s\n' % (name, value)
-				break
-		# If arguement does not exist, create one
-		else:
-			lines.append('%s = %s\n\n' % (name, value))
+	def set_many(self, values):
+		"""Set several values with a single write of the file.
 
-		# Save the file
-		conf = open(self.DIR+self.db,'w')
-		conf.writelines(lines)
-		conf.close()
+		The new file is written next to the old one and renamed over it, so
+		readers never see it half written.
+		"""
+		with self._lock:
+			self._load()
+			lines = list(self._lines)
+			index = self._index
+			for name, value in values.items():
+				if name in index:
+					lines[index[name]] = '%s = %s\n' % (name, value)
+				else:
+					# If arguement does not exist, create one
+					lines.append('%s = %s\n\n' % (name, value))
+			self._write(lines)
+			self._index_lines(lines)
+
+	def _write(self, lines):
+		fd, tmp = tempfile.mkstemp(prefix='.%s.'%self.db, dir=self.DIR)
+		try:
+			with os.fdopen(fd, 'w') as conf:
+				conf.writelines(lines)
+				conf.flush()
+				os.fsync(conf.fileno())
+			try:
+				# Keep the owner and mode, the file is often shared with a
+				# non-root user.
+				st = os.stat(self.path)
+				os.chmod(tmp, st.st_mode & 0o7777)
+				os.chown(tmp, st.st_uid, st.st_gid)
+			except OSError:
+				pass
+			os.replace(tmp, self.path)
+		except BaseException:
+			try:
+				os.unlink(tmp)
+			except OSError:
+				pass
+			raise
+		st = os.stat(self.path)
+		self._stamp = (st.st_mtime_ns, st.st_size)
+		self._error = None
 
 def test():
 	name = "hhh"
@@ -83,4 +171,4 @@ def test():
 	print("Get exist: %s" % db.get(name, 0))
 
 if __name__ == "__main__":
-	test()
\ No newline at end of file
+	test()
@@ -0,0 +1,126 @@
+"""Vectorized filters for ADC sample windows.
+
+Filters work on a window of samples from a ``Sampler`` ring buffer, shaped
+``(samples, channels)`` with the oldest sample first, and return another
+window.  Each one is a handful of NumPy calls over the whole window, so
+there is no Python work per sample or per channel.  Chain them with
+``FilterChain``:
+
+    chain = FilterChain(RejectOutliers(3.0), Median(5), EMA(0.3))
+    timestamp, values = chain.read(fc.sensors)
+"""
+import math
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class RejectOutliers(object):
+    """Replace samples further than ``k`` median absolute deviations from
+    their channel's median with that median."""
+
+    def __init__(self, k=3.0):
+        self.k = k
+
+    def inputs(self, outputs):
+        return max(outputs, 3)
+
+    def __call__(self, values):
+        median = np.median(values, axis=0)
+        deviation = np.abs(values - median)
+        mad = np.median(deviation, axis=0)
+        # A flat channel has no spread; only exact matches are kept then.
+        return np.where(deviation > self.k * mad, median, values)
+
+
+class Oversample(object):
+    """Average every ``n`` consecutive samples into one."""
+
+    def __init__(self, n=4):
+        self.n = n
+
+    def inputs(self, outputs):
+        return outputs * self.n
+
+    def __call__(self, values):
+        rows = len(values) // self.n * self.n
+        if rows == 0:
+            return values.mean(axis=0, keepdims=True)
+        values = values[len(values) - rows:]
+        return values.reshape(-1, self.n, values.shape[1]).mean(axis=1)
+
+
+class Median(object):
+    """Sliding median over ``n`` samples."""
+
+    def __init__(self, n=5):
+        self.n = n
+
+    def inputs(self, outputs):
+        return outputs + self.n - 1
+
+    def __call__(self, values):
+        if len(values) < self.n:
+            return np.median(values, axis=0, keepdims=True)
+        return np.median(sliding_window_view(values, self.n, axis=0), axis=-1)
+
+
+class EMA(object):
+    """Exponential moving average, evaluated at the newest sample.
+
+    Weights older than ``tolerance`` of the newest one are dropped, which
+    bounds the window it needs.  Returns a single row, so it goes last in a
+    chain.
+    """
+
+    def __init__(self, alpha=0.3, tolerance=1e-3):
+        self.alpha = alpha
+        if alpha >= 1:
+            self.length = 1
+        else:
+            self.length = max(1, int(math.ceil(math.log(tolerance) / math.log(1 - alpha))) + 1)
+        self._weights = alpha * (1 - alpha) ** np.arange(self.length - 1, -1, -1)
+
+    def inputs(self, outputs):
+        return self.length
+
+    def __call__(self, values):
+        weights = self._weights[-len(values):]
+        return (weights @ values[-len(weights):] / weights.sum())[np.newaxis]
+
+
+class FilterChain(object):
+    """Filters applied in order to a window of samples.
+
+    ``window`` defaults to the number of samples the stages need to
+    produce one output.
+    """
+
+    def __init__(self, *stages, window=None):
+        self.stages = stages
+        if window is None:
+            window = 1
+            for stage in reversed(stages):
+                window = stage.inputs(window)
+        self.window = window
+
+    def apply(self, values):
+        """Filtered newest value of each channel from a sample window."""
+        values = np.asarray(values, dtype=np.float64)
+        for stage in self.stages:
+            values = stage(values)
+        return values[-1]
+
+    def read(self, sampler, max_age=None):
+        """``(timestamp, values)`` of the newest sample in ``sampler``,
+        filtered over the last ``window`` samples.
+
+        Like ``Sampler.latest``, if there is no sample yet or the newest is
+        older than ``max_age`` seconds, the group is read directly instead;
+        that reading is returned unfiltered.
+        """
+        times, values = sampler.window(self.window)
+        if len(times) == 0 or (max_age is not None and time.monotonic() - times[-1] > max_age):
+            timestamp, values = sampler.latest(max_age)
+            return timestamp, values.astype(np.float64)
+        return times[-1], self.apply(values)
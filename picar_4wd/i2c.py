@@ -1,7 +1,313 @@
-from smbus2 import SMBus
+from .backend import SMBus
 from .utils import soft_reset
+from .trace import BusTrace
+from contextlib import contextmanager
+import threading
 import time
 
+
+class BusUnavailableError(OSError):
+    """Raised without touching the bus while its circuit breaker is open."""
+
+
+class SharedBus(object):
+    """One SMBus handle per bus number, shared by every I2C object.
+
+    The handle is reference counted: it is opened by the first ``acquire``
+    and closed again when the last user calls ``release``.  ``lock`` guards
+    every access to the handle.  ``generation`` is bumped each time the
+    handle is reopened so that callers which failed on the same broken
+    handle recover only once between them instead of once per instance.
+
+    ``locked`` takes the lock and records how long each caller waited for
+    it, see ``lock_stats``.
+
+    Calls that still fail after every retry are counted per device address.
+    After ``BREAKER_THRESHOLD`` such failures in a row the circuit breaker
+    opens and calls fail fast with ``BusUnavailableError`` for
+    ``BREAKER_COOLDOWN`` seconds.  The first failure after the cool-down
+    opens it again straight away; the first success closes it.
+    """
+    _buses = {}
+    _buses_lock = threading.Lock()
+    # Sleeps before each plain retry, in seconds.
+    BACKOFF = (0.001, 0.004)
+    # Time the MCU gets to come back after a reset.
+    RESET_SETTLE = 0.05
+    BREAKER_THRESHOLD = 3
+    BREAKER_COOLDOWN = 1.0
+    # Addresses the HAT MCU may answer on, in order of preference.
+    MCU_ADDRESSES = (0x14, 0x15)
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.lock = threading.RLock()
+        self.refs = 0
+        self.generation = 0
+        self.recovering = False
+        self.smbus = SMBus(bus)
+        self._local = threading.local()
+        self._waits = {}
+        self._recoveries = {}
+        self._devices = {}
+        self._failures = 0
+        self._open_until = 0.0
+        self._trips = 0
+        self._rejected = 0
+        self._trip_handlers = []
+        self.trace = BusTrace()
+        self._devices_found = None
+        self._mcu_address = None
+
+    @contextmanager
+    def locked(self, caller=None):
+        start = time.monotonic()
+        self.lock.acquire()
+        wait = time.monotonic() - start
+        stat = self._waits.get(caller)
+        if stat is None:
+            stat = self._waits[caller] = [0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += wait
+        if wait > stat[2]:
+            stat[2] = wait
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            yield wait
+        finally:
+            self._local.depth -= 1
+            self.lock.release()
+
+    def in_call(self):
+        """True if the current thread is already inside ``locked``."""
+        return getattr(self._local, "depth", 0) > 0
+
+    def lock_stats(self):
+        """Lock wait per caller: count, total, mean and max wait in seconds."""
+        with self.lock:
+            return {
+                caller: {
+                    "count": count,
+                    "total": total,
+                    "mean": total / count if count else 0.0,
+                    "max": longest,
+                }
+                for caller, (count, total, longest) in self._waits.items()
+            }
+
+    def reset_lock_stats(self):
+        with self.lock:
+            self._waits.clear()
+
+    @classmethod
+    def acquire(cls, bus=1):
+        with cls._buses_lock:
+            shared = cls._buses.get(bus)
+            if shared is None:
+                shared = cls(bus)
+                cls._buses[bus] = shared
+            shared.refs += 1
+            return shared
+
+    def release(self):
+        with SharedBus._buses_lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            SharedBus._buses.pop(self.bus, None)
+        with self.lock:
+            try:
+                self.smbus.close()
+            except Exception:
+                pass
+
+    def recover(self, generation, attempt):
+        """Take step ``attempt`` (0 based) of the recovery ladder.
+
+        The first ``len(BACKOFF)`` failures only wait and retry, the next
+        one reopens the bus, and anything after that resets the MCU.
+        Returns the name of the tier used.
+        """
+        if attempt < len(self.BACKOFF):
+            time.sleep(self.BACKOFF[attempt])
+            return "retry"
+        if attempt == len(self.BACKOFF):
+            self.reopen(generation)
+            return "reopen"
+        if self.reconnect(generation):
+            time.sleep(self.RESET_SETTLE)
+        return "reset"
+
+    def reopen(self, generation):
+        """Close and reopen the bus handle unless someone already did.
+
+        ``generation`` is the value the caller saw before its failed call.
+        Returns True if this call did the reopen.
+        """
+        with self.lock:
+            if generation != self.generation or self.recovering:
+                return False
+            try:
+                self.smbus.close()
+            except Exception:
+                pass
+            self.smbus = SMBus(self.bus)
+            self.generation += 1
+            return True
+
+    def reconnect(self, generation):
+        """Reopen the bus and reset the MCU unless someone already did.
+
+        ``soft_reset`` replays the cached PWM registers afterwards.  Failures
+        raised while that replay runs do not start a nested reconnect, and
+        if the replay fails for good it is left pending (see
+        ``PWM.restore``) so the caller's own retry and error go on as usual.
+        Returns True if this call did the reconnect.
+        """
+        with self.lock:
+            if not self.reopen(generation):
+                return False
+            self.recovering = True
+            try:
+                soft_reset()
+            except OSError as e:
+                print(f"I/O error in soft_reset: {e}, PWM restore left pending")
+            finally:
+                self.recovering = False
+            return True
+
+    def probe(self, addr):
+        """True if a device acknowledges a read from ``addr``."""
+        with self.lock:
+            try:
+                self.smbus.read_byte(addr)
+                return True
+            except OSError:
+                return False
+
+    def scan(self, force=False):
+        """Addresses 0x03-0x77 that answer, probed once and then cached."""
+        with self.lock:
+            if self._devices_found is None or force:
+                self._devices_found = [addr for addr in range(0x03, 0x78) if self.probe(addr)]
+            return list(self._devices_found)
+
+    def mcu_address(self, candidates=None):
+        """Address the HAT MCU answers on.
+
+        The candidates (0x14 and 0x15 by default) are probed once per bus,
+        on first use, and the answer is shared by every later constructor.
+        Returns None, without caching, if none of them answer.
+        """
+        if candidates is None:
+            candidates = self.MCU_ADDRESSES
+        with self.lock:
+            if self._mcu_address is None:
+                for addr in candidates:
+                    if self.probe(addr):
+                        self._mcu_address = addr
+                        break
+                else:
+                    print("No HAT MCU found at {}".format(
+                        ", ".join("0x{:02X}".format(addr) for addr in candidates)))
+            return self._mcu_address
+
+    def check_breaker(self):
+        """Raise ``BusUnavailableError`` if the breaker is open."""
+        if self._open_until and time.monotonic() < self._open_until:
+            self._rejected += 1
+            raise BusUnavailableError(
+                "I2C bus {} unavailable, circuit breaker open".format(self.bus))
+
+    def record_call(self, addr, ok):
+        """Count a finished call to ``addr`` and trip the breaker if needed."""
+        tripped = False
+        with self.lock:
+            stat = self._devices.get(addr)
+            if stat is None:
+                stat = self._devices[addr] = [0, 0, 0]
+            stat[0] += 1
+            if ok:
+                stat[2] = 0
+                self._failures = 0
+                self._open_until = 0.0
+                return
+            stat[1] += 1
+            stat[2] += 1
+            self._failures += 1
+            if self._failures >= self.BREAKER_THRESHOLD:
+                now = time.monotonic()
+                tripped = self._open_until <= now
+                self._open_until = now + self.BREAKER_COOLDOWN
+                if tripped:
+                    self._trips += 1
+        if tripped:
+            for handler in list(self._trip_handlers):
+                try:
+                    handler(self)
+                except Exception as e:
+                    print(f"Error in I2C breaker handler {handler}: {e}")
+
+    def add_trip_handler(self, handler):
+        """Call ``handler(bus)`` whenever the breaker opens.
+
+        The breaker is already open when handlers run, so they should not
+        need the bus themselves.
+        """
+        self._trip_handlers.append(handler)
+
+    def remove_trip_handler(self, handler):
+        self._trip_handlers.remove(handler)
+
+    def device_stats(self):
+        """Calls, failed calls, error rate and consecutive failures per
+        device address."""
+        with self.lock:
+            return {
+                addr: {
+                    "calls": calls,
+                    "errors": errors,
+                    "error_rate": errors / calls if calls else 0.0,
+                    "consecutive_failures": consecutive,
+                }
+                for addr, (calls, errors, consecutive) in self._devices.items()
+            }
+
+    def breaker_state(self):
+        retry_in = max(0.0, self._open_until - time.monotonic())
+        return {
+            "open": retry_in > 0,
+            "retry_in": retry_in,
+            "consecutive_failures": self._failures,
+            "trips": self._trips,
+            "rejected": self._rejected,
+        }
+
+    def record_recovery(self, tier, latency):
+        with self.lock:
+            stat = self._recoveries.get(tier)
+            if stat is None:
+                stat = self._recoveries[tier] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += latency
+            if latency > stat[2]:
+                stat[2] = latency
+
+    def recovery_stats(self):
+        """Recovered calls per highest tier used: count, total, mean and max
+        time from the first failure to success, in seconds."""
+        with self.lock:
+            return {
+                tier: {
+                    "count": count,
+                    "total": total,
+                    "mean": total / count if count else 0.0,
+                    "max": longest,
+                }
+                for tier, (count, total, longest) in self._recoveries.items()
+            }
+
+
 class I2C(object):
     MASTER = 0
     SLAVE  = 1
@@ -9,92 +315,191 @@ class I2C(object):
 
     def __init__(self, *args, **kargs):    
         self._bus = 1
-        self._smbus = SMBus(self._bus)
+        self._shared = SharedBus.acquire(self._bus)
+        self.caller = kargs.get("caller") or type(self).__name__
+        self.fallback = None
+
+    @property
+    def _smbus(self):
+        return self._shared.smbus
+
+    def close(self):
+        """Drop this object's reference to the shared bus."""
+        if self._shared is not None:
+            self._shared.release()
+            self._shared = None
+
+    def set_fallback(self, handler):
+        """Have reads such as ``ADC.read`` return ``handler(exc)`` instead of
+        raising when the bus call fails for good or the breaker is open."""
+        self.fallback = handler
+
+    def _fail(self, exc):
+        if self.fallback is None:
+            raise exc
+        return self.fallback(exc)
 
     def auto_reset(func):
         """Decorator to automatically reset the I2C bus on errors.
 
-        The previous implementation only attempted the failing operation once
-        after resetting the controller.  In practice the I2C bus can require a
-        few retries before recovering, so here we try up to ``RETRY`` times
-        before giving up.  Each failure triggers a soft reset and the bus is
-        reinitialised.  The name of the function that failed is printed to aid
-        debugging.
+        The operation is tried up to ``RETRY`` times.  Failures climb the
+        recovery ladder in ``SharedBus.recover``: short backoff retries
+        first, then reopening the bus, and only then a soft reset of the MCU.
+        The time from the first failure to success is recorded per tier, see
+        ``recovery_stats``.  The name of the function that failed is printed
+        to aid debugging.  Calls made from inside another wrapped call (see
+        ``transaction``) are not retried on their own.
+
+        Every outermost call is reported to the breaker, and while it is open
+        the call fails fast with ``BusUnavailableError``.
         """
 
         def wrapper(self, *args, **kw):
+            # Inside a transaction the outermost call owns the lock and the
+            # retries, so the whole sequence is repeated rather than one step.
+            if self._shared.in_call():
+                return func(self, *args, **kw)
+            shared = self._shared
+            shared.check_breaker()
+            addr = getattr(self, "ADDR", None)
             last_exc = None
-            for _ in range(self.RETRY):
+            tier = None
+            for attempt in range(self.RETRY):
+                generation = shared.generation
                 try:
-                    return func(self, *args, **kw)
+                    with shared.locked(self.caller):
+                        result = func(self, *args, **kw)
+                    if tier is not None:
+                        shared.record_recovery(tier, time.monotonic() - failed_at)
+                    shared.record_call(addr, True)
+                    return result
                 except OSError as e:
+                    if last_exc is None:
+                        failed_at = time.monotonic()
                     last_exc = e
+                    if attempt == self.RETRY - 1:
+                        break
+                    if shared.trace.enabled:
+                        shared.trace.record_retry(self.caller, addr)
+                    tier = shared.recover(generation, attempt)
                     print(
-                        f"I/O error in {func.__name__}: {e}, resetting I2C bus"
+                        f"I/O error in {func.__name__}: {e}, recovering I2C bus ({tier})"
                     )
-                    soft_reset()
-                    try:
-                        self._smbus.close()
-                    except Exception:
-                        pass
-                    self._smbus = SMBus(self._bus)
-                    time.sleep(0.05)
+            shared.record_call(addr, False)
             # If all retries failed, re-raise the last exception
             raise last_exc
 
         return wrapper
 
+    def _io(self, op, addr, reg, nbytes, call, *args):
+        trace = self._shared.trace
+        if not trace.enabled:
+            return call(*args)
+        start = time.perf_counter()
+        try:
+            result = call(*args)
+        except OSError:
+            trace.record(self.caller, op, addr, reg, nbytes, time.perf_counter() - start, False)
+            raise
+        trace.record(self.caller, op, addr, reg, nbytes, time.perf_counter() - start, True)
+        return result
+
     @auto_reset
     def _i2c_write_byte(self, addr, data):   
         # self._debug("_i2c_write_byte: [0x{:02X}] [0x{:02X}]".format(addr, data))
-        return self._smbus.write_byte(addr, data)
+        return self._io("write_byte", addr, None, 1, self._smbus.write_byte, addr, data)
     
     @auto_reset
     def _i2c_write_byte_data(self, addr, reg, data):
         # self._debug("_i2c_write_byte_data: [0x{:02X}] [0x{:02X}] [0x{:02X}]".format(addr, reg, data))
-        return self._smbus.write_byte_data(addr, reg, data)
+        return self._io("write_byte_data", addr, reg, 2, self._smbus.write_byte_data, addr, reg, data)
     
     @auto_reset
     def _i2c_write_word_data(self, addr, reg, data):
         # self._debug("_i2c_write_word_data: [0x{:02X}] [0x{:02X}] [0x{:04X}]".format(addr, reg, data))
-        return self._smbus.write_word_data(addr, reg, data)
+        return self._io("write_word_data", addr, reg, 3, self._smbus.write_word_data, addr, reg, data)
     
     @auto_reset
     def _i2c_write_i2c_block_data(self, addr, reg, data):
         # self._debug("_i2c_write_i2c_block_data: [0x{:02X}] [0x{:02X}] {}".format(addr, reg, data))
-        return self._smbus.write_i2c_block_data(addr, reg, data)
+        return self._io("write_i2c_block_data", addr, reg, 1 + len(data), self._smbus.write_i2c_block_data, addr, reg, data)
     
     @auto_reset
     def _i2c_read_byte(self, addr):  
         # self._debug("_i2c_read_byte: [0x{:02X}]".format(addr))
-        return self._smbus.read_byte(addr)
+        return self._io("read_byte", addr, None, 1, self._smbus.read_byte, addr)
 
     @auto_reset
     def _i2c_read_i2c_block_data(self, addr, reg, num):
         # self._debug("_i2c_read_i2c_block_data: [0x{:02X}] [0x{:02X}] [{}]".format(addr, reg, num))
-        return self._smbus.read_i2c_block_data(addr, reg, num)
+        return self._io("read_i2c_block_data", addr, reg, 1 + num, self._smbus.read_i2c_block_data, addr, reg, num)
+
+    def transaction(self, ops, addr):
+        """Run several operations on ``addr`` under one bus lock.
+
+        ``ops`` is a list of tuples, each one of ``("send", data)``,
+        ``("recv", num)``, ``("mem_write", memaddr, data)`` or
+        ``("mem_read", memaddr, num)``.  No other thread can use the bus
+        between the steps, and on an I/O error the whole sequence is retried.
+        Returns the results of the read steps in order.
+        """
+        return self._transaction(ops, addr)
+
+    @auto_reset
+    def _transaction(self, ops, addr):
+        results = []
+        for op in ops:
+            if op[0] == "send":
+                self.send(op[1], addr)
+            elif op[0] == "recv":
+                results.append(self.recv(op[1], addr))
+            elif op[0] == "mem_write":
+                self.mem_write(op[2], addr, op[1])
+            elif op[0] == "mem_read":
+                results.append(self.mem_read(op[2], addr, op[1]))
+            else:
+                raise ValueError("unknown i2c transaction step: {}".format(op[0]))
+        return results
+
+    def lock_stats(self):
+        """How long each caller has waited for the bus lock."""
+        return self._shared.lock_stats()
+
+    def recovery_stats(self):
+        """How long recovering from bus errors took, per tier."""
+        return self._shared.recovery_stats()
+
+    def device_stats(self):
+        """Error counters per device address on this bus."""
+        return self._shared.device_stats()
+
+    def breaker_state(self):
+        return self._shared.breaker_state()
+
+    def enable_trace(self, enabled=True):
+        """Turn per call bus instrumentation on or off for this bus."""
+        self._shared.trace.enable(enabled)
+
+    def trace_snapshot(self, recent=False):
+        """Bus counters and latency histograms, see ``BusTrace.snapshot``."""
+        return self._shared.trace.snapshot(recent)
 
     def is_ready(self, addr):
+        if isinstance(addr, int):
+            addr = "{:02x}".format(addr)
         addresses = self.scan()
         if addr in addresses:
             return True
         else:
             return False
 
-    def scan(self):                            
-        cmd = "i2cdetect -y %s" % self._bus
-        _, output = self.run_command(cmd)          
-        outputs = output.split('\n')[1:]       
-       # self._debug("outputs")
-        addresses = []
-        for tmp_addresses in outputs:
-            tmp_addresses = tmp_addresses.split(':')[1]
-            tmp_addresses = tmp_addresses.strip().split(' ')    
-            for address in tmp_addresses:
-                if address != '--':
-                    addresses.append(address)
-     #   self._debug("Conneceted i2c device: %s"%addresses)                   
-        return addresses
+    def scan(self, force=False):
+        """Addresses that answer on the bus, as hex strings like ``'14'``.
+
+        The bus is probed in-process once and the result cached; ``force``
+        probes it again.
+        """
+        return ["{:02x}".format(addr) for addr in self._shared.scan(force)]
 
     def send(self, send, addr, timeout=0):                     
         if isinstance(send, bytearray):
@@ -1,20 +1,16 @@
-import threading
+from .pwm import PWM
+from .pin import Pin
 
 class Motor():
-    STEP = 10
-    DELAY = 0.1
     def __init__(self, pwm_pin, dir_pin, is_reversed=False):
         self.pwm_pin = pwm_pin
         self.dir_pin = dir_pin
         self._is_reversed = is_reversed
         self._power = 0
-        self._except_power = 0
-    
-    # def start_timer(self):
-    #     self.t = threading.Timer(self.DELAY, self.adder_thread)
-    #     self.t.start()
 
-    def set_power(self, power):
+    def frame(self, power):
+        """Direction pin level and pulse width percent for ``power``,
+        without touching the hardware."""
         if power >= 0:
             direction = 0
         elif power < 0:
@@ -22,33 +18,54 @@ class Motor():
         power = abs(power)
         if power != 0:
             power = int(power /2 ) + 20
-        power = power
 
         direction = direction if not self._is_reversed else not direction
+        return direction, power
+
+    def set_power(self, power):
+        self._power = power
+        direction, power = self.frame(power)
         try:
             self.dir_pin.value(direction)
             self.pwm_pin.pulse_width_percent(power)
         except OSError as e:
             print(f"I/O error in Motor.set_power: {e}")
 
-#     def adder_thread(self):
-#         if self._except_power > self._power:
-#             step = self.STEP
-#         else:
-#             step = -self.STEP
-#         if abs(self._except_power - self._power) < self.STEP:
-#             self._power = self._except_power
-#         else:
-#             self._power += step
-#         self._set_power(self._power)
-#         if self._power != self._except_power:
-#             self.start_timer()
-
-#     def set_power(self, power):
-#         # print("Power: {}".format(power))
-#         self._except_power = power
-#         if self._power != self._except_power:
-#             self.start_timer()
+def set_power_frame(motors, powers):
+    """Set several motors in one go.
+
+    All direction levels and pulse widths are worked out first, then the
+    direction pins are written with one GPIO call and the pulse widths are
+    committed with ``PWM.pulse_width_many``, so the wheels switch as close
+    together as the bus allows.
+    """
+    frames = [motor.frame(power) for motor, power in zip(motors, powers)]
+    for motor, power in zip(motors, powers):
+        motor._power = power
+    items = []
+    try:
+        Pin.write_many([(motor.dir_pin, direction) for motor, (direction, _) in zip(motors, frames)])
+        for motor, (_, percent) in zip(motors, frames):
+            motor.pwm_pin._pulse_width_percent = percent / 100.0
+            items.append((motor.pwm_pin, percent / 100.0 * motor.pwm_pin._arr))
+        PWM.pulse_width_many(items)
+    except OSError as e:
+        print(f"I/O error in set_power_frame: {e}")
+
+def arcade_mix(throttle, steer, limit=100):
+    """Left and right side powers for a ``throttle`` and a ``steer``
+    (positive turns right), both -``limit`` to ``limit``.
+
+    When a side would go past ``limit`` both sides are scaled down
+    together, so the turn keeps its shape at full throttle.
+    """
+    left = throttle + steer
+    right = throttle - steer
+    peak = max(abs(left), abs(right))
+    if peak > limit:
+        left = left * limit / peak
+        right = right * limit / peak
+    return left, right
 
 # if __name__ == "__main__":
 #     import picar-4wd as fc
@@ -0,0 +1,76 @@
+import math
+import threading
+import time
+import numpy as np
+from .periodic import Periodic
+
+
+class Odometry(Periodic):
+    """Dead reckoning pose from wheel encoder speeds.
+
+    The encoders only measure how fast a wheel turns, not which way, so the
+    direction of each side comes from the last drive command (see
+    ``command``).  The pose ``(x, y, heading)`` is in cm and radians,
+    starting at the origin facing along +x, and is integrated at ``rate``
+    Hz by one thread.  While ``recording`` is set, every step is stored as
+    ``(time, x, y, heading)`` in a fixed size ring buffer.
+    """
+    TRACK = 14.0    # distance between the left and right wheels in cm
+
+    def __init__(self, left, right, rate=50, track=None, size=1024):
+        super().__init__(rate)
+        self.left = left
+        self.right = right
+        if track is not None:
+            self.TRACK = track
+        self.size = size
+        self.recording = False
+        self._history = np.zeros((size, 4))
+        self._count = 0
+        self._direction = (0, 0)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def command(self, left, right):
+        """Commanded direction of each side: any number, only its sign is used."""
+        self._direction = ((left > 0) - (left < 0), (right > 0) - (right < 0))
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        with self._lock:
+            self.x = x
+            self.y = y
+            self.heading = heading
+            self._count = 0
+
+    def pose(self):
+        with self._lock:
+            return self.x, self.y, self.heading
+
+    def step(self, dt):
+        """Advance the pose by ``dt`` seconds at the current wheel speeds."""
+        left_dir, right_dir = self._direction
+        v_left = left_dir * self.left()
+        v_right = right_dir * self.right()
+        v = (v_left + v_right) / 2.0
+        w = (v_right - v_left) / self.TRACK
+        with self._lock:
+            # Midpoint heading keeps arcs from drifting outwards.
+            heading = self.heading + w * dt / 2.0
+            self.x += v * dt * math.cos(heading)
+            self.y += v * dt * math.sin(heading)
+            self.heading = math.atan2(math.sin(self.heading + w * dt), math.cos(self.heading + w * dt))
+            if self.recording:
+                self._history[self._count % self.size] = (time.monotonic(), self.x, self.y, self.heading)
+                self._count += 1
+
+    def history(self, num=None):
+        """Recorded ``(time, x, y, heading)`` rows, oldest first."""
+        with self._lock:
+            available = min(self._count, self.size)
+            if num is not None:
+                available = min(available, num)
+            index = np.arange(self._count - available, self._count) % self.size
+            return self._history[index]
+
+    def _tick(self, now, dt):
+        self.step(dt)
@@ -0,0 +1,99 @@
+import threading
+import time
+
+
+class Periodic(object):
+    """Base for objects that do their work on one thread at ``rate`` Hz.
+
+    Subclasses implement ``_tick(now, dt)``, where ``dt`` is the time since
+    the previous tick.  ``start`` is idempotent, ``stop`` ends the thread
+    at its next wake-up and ``deinit`` stops and joins it.  A tick that
+    falls behind skips the missed periods instead of bursting, and counts
+    an overrun.  Every ``OSError`` from a tick is counted in ``errors``,
+    but only the first of a run of failing ticks is printed, so an open
+    circuit breaker does not flood the output.
+
+    A subclass with nothing to do between bursts of work can override
+    ``_idle``; the thread then waits for ``_wake.set()`` instead of ticking.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.errors = 0
+        self.overruns = 0
+        self._wake = threading.Event()
+        self._stop_event = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def running(self):
+        stop_event = self._stop_event
+        return stop_event is not None and not stop_event.is_set()
+
+    def start(self, rate=None):
+        if rate is not None:
+            self.rate = rate
+        with self._thread_lock:
+            if self.running:
+                return
+            # Each run gets its own stop event, so a thread that has not
+            # finished stopping yet cannot keep running after a restart.
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._loop, args=(self._stop_event,),
+                name=type(self).__name__, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        stop_event = self._stop_event
+        if stop_event is not None:
+            stop_event.set()
+        self._wake.set()
+
+    def join(self, timeout=None):
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def deinit(self):
+        self.stop()
+        self.join()
+
+    def _idle(self):
+        return False
+
+    def _tick(self, now, dt):
+        raise NotImplementedError
+
+    def _loop(self, stop_event):
+        last = next_time = time.monotonic()
+        failing = 0
+        while not stop_event.is_set():
+            if self._idle():
+                self._wake.clear()
+                if self._idle():
+                    self._wake.wait()
+                last = next_time = time.monotonic()
+                continue
+            next_time += 1.0 / self.rate
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                if stop_event.wait(delay):
+                    break
+            else:
+                self.overruns += 1
+                next_time = time.monotonic()
+            now = time.monotonic()
+            try:
+                self._tick(now, now - last)
+            except OSError as e:
+                self.errors += 1
+                if not failing:
+                    print(f"I/O error in {type(self).__name__}: {e}")
+                failing += 1
+            else:
+                if failing > 1:
+                    print(f"{type(self).__name__} recovered after {failing} I/O errors")
+                failing = 0
+            last = now
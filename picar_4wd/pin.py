@@ -1,4 +1,4 @@
-import RPi.GPIO as GPIO
+from .backend import GPIO
 
 class Pin(object):
     OUT = GPIO.OUT                  
@@ -9,6 +9,7 @@ class Pin(object):
     PULL_UP = GPIO.PUD_UP           
     PULL_DOWN = GPIO.PUD_DOWN       
     PULL_NONE = None                
+    _gpio_ready = False
     _dict = {                       
         "D0":  17,
         "D1":  18,
@@ -33,8 +34,10 @@ class Pin(object):
 
     def __init__(self, *value):
         super().__init__()          
-        GPIO.setmode(GPIO.BCM)      
-        GPIO.setwarnings(False)     
+        if not Pin._gpio_ready:
+            GPIO.setmode(GPIO.BCM)      
+            GPIO.setwarnings(False)     
+            Pin._gpio_ready = True
         if len(value) > 0:          
             pin = value[0]
         if len(value) > 1:          
@@ -56,13 +59,15 @@ class Pin(object):
             self._pin = pin
         else:
             self._error('Pin should be in %s, not %s' % (self._dict, pin))
-        self._value = 0
+        # Last level written, None while unknown
+        self._value = None
         self.init(mode, pull=setup)
     #    self._info("Pin init finished.")
         
     def init(self, mode, pull=PULL_NONE):   
         self._pull = pull
         self._mode = mode
+        self._value = None
         if mode != None:
             if pull != None:
                 GPIO.setup(self._pin, mode, pull_up_down=pull)
@@ -90,10 +95,44 @@ class Pin(object):
             return result
         else:                               
             value = value[0]
-            self.mode(self.OUT)
-            GPIO.output(self._pin, value)
+            self.write(value)
             return value
 
+    def write(self, value, force=False):
+        """Drive the pin as an output.  The pin is set up only when it was
+        not an output already, and a level equal to the last one written is
+        not sent again unless ``force`` is set."""
+        value = 1 if value else 0
+        if self._mode != self.OUT:
+            self.mode(self.OUT)
+        elif value == self._value and not force:
+            return False
+        GPIO.output(self._pin, value)
+        self._value = value
+        return True
+
+    @staticmethod
+    def write_many(items, force=False):
+        """Write ``(pin, value)`` pairs with a single GPIO call.
+
+        Pins already at the requested level are left out; returns the
+        number of pins written.
+        """
+        channels = []
+        values = []
+        for pin, value in items:
+            value = 1 if value else 0
+            if pin._mode != pin.OUT:
+                pin.mode(pin.OUT)
+            elif value == pin._value and not force:
+                continue
+            channels.append(pin._pin)
+            values.append(value)
+            pin._value = value
+        if channels:
+            GPIO.output(channels, values)
+        return len(channels)
+
     def on(self):                           
         return self.value(1)
 
@@ -111,8 +150,14 @@ class Pin(object):
             return self._mode
         else:
             mode = value[0]
+            if mode == self._mode:
+                return
             self._mode = mode
-            GPIO.setup(self._pin, mode)
+            self._value = None
+            if mode == self.IN and self._pull != None:
+                GPIO.setup(self._pin, mode, pull_up_down=self._pull)
+            else:
+                GPIO.setup(self._pin, mode)
 
     def pull(self, *value):     
         return self._pull
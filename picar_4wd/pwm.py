@@ -1,6 +1,31 @@
-import smbus, math
+import math
+import time
+from functools import lru_cache
 from .i2c import I2C
 
+
+@lru_cache(maxsize=None)
+def solve_freq(clock, freq):
+    """(prescaler, arr) pair that gets closest to ``freq`` from ``clock``."""
+    # [prescaler,arr] list
+    result_ap = []
+    # accuracy list
+    result_acy = []
+    # middle value for equal arr prescaler
+    st = int(math.sqrt(clock/freq))
+    # get -5 value as start
+    st -= 5
+    # prevent negetive value
+    if st <= 0:
+        st = 1
+    for psc in range(st,st+10):
+        arr = int(clock/freq/psc)
+        result_ap.append([psc, arr])
+        result_acy.append(abs(freq-clock/psc/arr))
+    i = result_acy.index(min(result_acy))
+    return result_ap[i][0], result_ap[i][1]
+
+
 class PWM(I2C):
     REG_CHN = 0x20
     REG_FRE = 0x30
@@ -9,6 +34,18 @@ class PWM(I2C):
     ADDR = 0x14
     CLOCK = 72000000
     _instances = []
+    # Last value written to each HAT register, keyed by (address, register).
+    # Writes that would not change a register are skipped.
+    _shadow = {}
+    # Four channels share one timer.  Frequency each timer is configured
+    # for, keyed by (address, timer), so it is only set up once.
+    _timers = {}
+    # Set while the HAT has been reset but the shadow has not been written
+    # back to it yet, see restore().
+    _restore_pending = False
+    writes_issued = 0
+    writes_skipped = 0
+    write_time = 0.0
 
     def __init__(self, channel):
         super().__init__()
@@ -17,76 +54,83 @@ class PWM(I2C):
                 channel = int(channel[1:])
             else:
                 raise ValueError("PWM channel should be between [P1, P14], not {0}".format(channel))
-        try:
-            self.send(0x2C, self.ADDR)
-            self.send(0, self.ADDR)
-            self.send(0, self.ADDR)
-        except IOError as e:
-            print(f"I/O error in PWM.__init__: {e}, switching to 0x15")
-            self.ADDR = 0x15
+        self.ADDR = self._shared.mcu_address() or self.ADDR
 
       #  self.debug = debug
       #  self._debug("PWM address: {:02X}".format(self.ADDR))
         self.channel = channel
         self.timer = int(channel/4)
-        self.bus = smbus.SMBus(1)
         self._pulse_width = 0
         self._freq = 50
         self.freq(50)
         PWM._instances.append(self)
 
-    def i2c_write(self, reg, value):
+    def i2c_write(self, reg, value, force=False):
+        """Write a 16 bit register, unless the shadow says it already holds
+        ``value``.  ``force`` writes it regardless.  Returns True if the
+        bus was used."""
+        return self._write_reg(reg, value, force)
+
+    @I2C.auto_reset
+    def _write_reg(self, reg, value, force):
+        self._restore_if_pending()
+        key = (self.ADDR, reg)
+        if not force and PWM._shadow.get(key) == value:
+            PWM.writes_skipped += 1
+            return False
         value_h = value >> 8
         value_l = value & 0xff
     #   self._debug("i2c write: [0x%02X, 0x%02X, 0x%02X, 0x%02X]"%(self.ADDR, reg, value_h, value_l))
+        start = time.monotonic()
         self.send([reg, value_h, value_l], self.ADDR)
+        PWM.write_time += time.monotonic() - start
+        PWM._shadow[key] = value
+        PWM.writes_issued += 1
+        return True
 
-    def freq(self, *freq):
+    def freq(self, *freq, force=False):
         if len(freq) == 0:
             return self._freq
         else:
             self._freq = int(freq[0])
-            # [prescaler,arr] list
-            result_ap = []
-            # accuracy list
-            result_acy = []
-            # middle value for equal arr prescaler
-            st = int(math.sqrt(self.CLOCK/self._freq))
-            # get -5 value as start
-            st -= 5
-            # prevent negetive value
-            if st <= 0:
-                st = 1
-            for psc in range(st,st+10):
-                arr = int(self.CLOCK/self._freq/psc)
-                result_ap.append([psc, arr])
-                result_acy.append(abs(self._freq-self.CLOCK/psc/arr))
-            i = result_acy.index(min(result_acy))
-            psc = result_ap[i][0]
-            arr = result_ap[i][1]
+            psc, arr = solve_freq(self.CLOCK, self._freq)
+            key = (self.ADDR, self.timer)
+            if not force and PWM._timers.get(key) == self._freq:
+                self._prescaler = psc - 1
+                self._arr = arr - 1
+                return
         #   self._debug("prescaler: %s, period: %s"%(psc, arr))
-            self.prescaler(psc)
-            self.period(arr)
+            self.prescaler(psc, force=force)
+            self.period(arr, force=force)
+            PWM._timers[key] = self._freq
+            # Keep the other channels on this timer in step with it.
+            for inst in PWM._instances:
+                if inst is not self and (inst.ADDR, inst.timer) == key:
+                    inst._freq = self._freq
+                    inst._prescaler = self._prescaler
+                    inst._arr = self._arr
 
-    def prescaler(self, *prescaler):
+    def prescaler(self, *prescaler, force=False):
         if len(prescaler) == 0:
             return self._prescaler
         else:
             self._prescaler = int(prescaler[0]) - 1
+            PWM._timers.pop((self.ADDR, self.timer), None)
             reg = self.REG_PSC + self.timer
         #    self._debug("Set prescaler to: %s"%self._prescaler)
-            self.i2c_write(reg, self._prescaler)
+            self.i2c_write(reg, self._prescaler, force)
 
-    def period(self, *arr):
+    def period(self, *arr, force=False):
         if len(arr) == 0:
             return self._arr
         else:
             self._arr = int(arr[0]) - 1
+            PWM._timers.pop((self.ADDR, self.timer), None)
             reg = self.REG_ARR + self.timer
         #    self._debug("Set arr to: %s"%self._arr)
-            self.i2c_write(reg, self._arr)
+            self.i2c_write(reg, self._arr, force)
 
-    def pulse_width(self, *pulse_width):
+    def pulse_width(self, *pulse_width, force=False):
         if len(pulse_width) == 0:
             return self._pulse_width
         else:
@@ -94,24 +138,124 @@ class PWM(I2C):
             reg = self.REG_CHN + self.channel
             # CCR = int(self._pulse_width/self.PRECISION * self._arr)
             # print("CCR: %s"%CCR)
-            self.i2c_write(reg, self._pulse_width)
+            self.i2c_write(reg, self._pulse_width, force)
 
-    def pulse_width_percent(self, *pulse_width_percent):
+    def pulse_width_percent(self, *pulse_width_percent, force=False):
         if len(pulse_width_percent) == 0:
             return self._pulse_width_percent
         else:
             self._pulse_width_percent = pulse_width_percent[0] / 100.0
             pulse_width = self._pulse_width_percent * self._arr
-            self.pulse_width(pulse_width)
+            self.pulse_width(pulse_width, force=force)
 
-    def reinit(self):
-        self.freq(self._freq)
-        self.pulse_width(self._pulse_width)
+    @classmethod
+    def pulse_width_many(cls, items, force=False):
+        """Set the pulse width of several channels in as few writes as possible.
+
+        ``items`` is a list of ``(pwm, pulse_width)`` pairs.  Channels whose
+        shadow already holds the value are dropped (unless ``force``), and
+        the rest are written as one block write per run of contiguous
+        channel registers on the same address.
+        """
+        by_addr = {}
+        for pwm, pulse_width in items:
+            pwm._pulse_width = int(pulse_width)
+            by_addr.setdefault(pwm.ADDR, {})[pwm.channel] = pwm
+        for pwms in by_addr.values():
+            channels = sorted(pwms.values(), key=lambda pwm: pwm.channel)
+            channels[0]._write_channels(channels, force)
+
+    @I2C.auto_reset
+    def _write_channels(self, pwms, force):
+        self._restore_if_pending()
+        changed = []
+        for pwm in pwms:
+            key = (self.ADDR, self.REG_CHN + pwm.channel)
+            if not force and PWM._shadow.get(key) == pwm._pulse_width:
+                PWM.writes_skipped += 1
+            else:
+                changed.append(pwm)
+        runs = []
+        for pwm in changed:
+            if runs and runs[-1][-1].channel + 1 == pwm.channel:
+                runs[-1].append(pwm)
+            else:
+                runs.append([pwm])
+        for run in runs:
+            data = [self.REG_CHN + run[0].channel]
+            for pwm in run:
+                data += [pwm._pulse_width >> 8, pwm._pulse_width & 0xff]
+            start = time.monotonic()
+            self.send(data, self.ADDR)
+            PWM.write_time += time.monotonic() - start
+            for pwm in run:
+                PWM._shadow[(self.ADDR, self.REG_CHN + pwm.channel)] = pwm._pulse_width
+            PWM.writes_issued += len(run)
+
+    def reinit(self, force=True):
+        self.freq(self._freq, force=force)
+        self.pulse_width(self._pulse_width, force=force)
 
     @classmethod
     def reinit_all(cls):
+        # The MCU has been reset, so neither the shadow nor the timer setup
+        # match it any more.  Each timer is configured once again.
+        cls._shadow.clear()
+        cls._timers.clear()
         for inst in cls._instances:
-            inst.reinit()
+            inst.reinit(force=False)
+
+    @classmethod
+    def flush(cls):
+        """Write every known register to the HAT again."""
+        cls.reinit_all()
+
+    @classmethod
+    def restore(cls):
+        """Replay every register written since start-up after an MCU reset.
+
+        The shadow holds the last value that was written successfully to each
+        register, so writing it back restores the HAT in one locked batch,
+        with contiguous registers sent as block writes.
+
+        If the replay fails, for example because the MCU is not back yet,
+        it stays pending and the next register write runs it first.
+        """
+        if cls._instances and cls._shadow:
+            cls._restore_pending = True
+            cls._instances[0]._replay(sorted(cls._shadow.items()))
+
+    def _restore_if_pending(self):
+        if PWM._restore_pending and PWM._shadow:
+            self._replay(sorted(PWM._shadow.items()))
+
+    @I2C.auto_reset
+    def _replay(self, items):
+        runs = []
+        for (addr, reg), value in items:
+            if runs and runs[-1][0] == addr and runs[-1][1] + len(runs[-1][2]) == reg:
+                runs[-1][2].append(value)
+            else:
+                runs.append((addr, reg, [value]))
+        for addr, reg, values in runs:
+            data = [reg]
+            for value in values:
+                data += [value >> 8, value & 0xff]
+            self.send(data, addr)
+            PWM.writes_issued += len(values)
+        PWM._restore_pending = False
+
+    @classmethod
+    def write_stats(cls):
+        """Counts of issued and skipped register writes, and an estimate of
+        the bus time the skipped ones saved."""
+        mean = cls.write_time / cls.writes_issued if cls.writes_issued else 0.0
+        return {
+            "issued": cls.writes_issued,
+            "skipped": cls.writes_skipped,
+            "write_time": cls.write_time,
+            "saved_time": mean * cls.writes_skipped,
+        }
 
         
 def test():
@@ -0,0 +1,109 @@
+import threading
+import time
+import numpy as np
+from .motor import set_power_frame
+from .periodic import Periodic
+
+
+class RampScheduler(Periodic):
+    """Ramps a set of motors towards target powers on one fixed-rate tick.
+
+    ``set_target`` only records the new ramp and returns; it never blocks
+    or starts a thread.  The tick thread, started once with ``start``,
+    moves every active ramp along and commits all powers in one batch
+    through ``commit(powers)``.  It sleeps while no ramp is active.
+
+    ``accel`` limits the rate of change in power per second.  The
+    ``"linear"`` profile changes at exactly that rate; ``"s-curve"`` eases
+    in and out, peaking at that rate, and takes 1.5 times as long.
+    """
+    LINEAR = "linear"
+    S_CURVE = "s-curve"
+
+    def __init__(self, motors, commit=None, rate=50, accel=200.0, profile=LINEAR):
+        super().__init__(rate)
+        self.motors = motors
+        self.commit = commit if commit is not None else (lambda powers: set_power_frame(motors, powers))
+        self.profile = profile
+        count = len(motors)
+        self.accel = np.ones(count)
+        self._set_accel(accel)
+        self.power = np.array([motor._power for motor in motors], dtype=np.float64)
+        self._start = self.power.copy()
+        self._target = self.power.copy()
+        self._t0 = np.zeros(count)
+        self._duration = np.zeros(count)
+        self._lock = threading.Lock()
+
+    def _set_accel(self, accel):
+        accel = np.broadcast_to(np.asarray(accel, dtype=np.float64), self.accel.shape)
+        if not np.all(accel > 0):
+            raise ValueError("accel should be greater than 0, not {0}".format(accel.tolist()))
+        self.accel[:] = accel
+
+    def _sync(self):
+        # Nothing is ramping: start from whatever the motors were last set
+        # to, which may have been a direct power command.
+        self.power[:] = [motor._power for motor in self.motors]
+        self._start[:] = self.power
+        self._target[:] = self.power
+
+    def set_target(self, powers, accel=None, profile=None):
+        """Start ramping each motor from where it is now to ``powers``.
+
+        The ramp only moves while the scheduler is running, see ``start``.
+        """
+        with self._lock:
+            if accel is not None:
+                self._set_accel(accel)
+            if profile is not None:
+                self.profile = profile
+            if np.array_equal(self.power, self._target):
+                self._sync()
+            target = np.asarray(powers, dtype=np.float64)
+            changed = target != self._target
+            duration = np.abs(target - self.power) / self.accel
+            if self.profile == self.S_CURVE:
+                duration *= 1.5
+            self._start[changed] = self.power[changed]
+            self._target[changed] = target[changed]
+            self._t0[changed] = time.monotonic()
+            self._duration[changed] = duration[changed]
+        self._wake.set()
+
+    def cancel(self):
+        """Stop every ramp where it is; the thread goes back to sleep.
+
+        A tick already committing finishes first, so a power command made
+        after ``cancel`` returns is never overwritten by the ramp.
+        """
+        with self._lock:
+            self._start[:] = self.power
+            self._target[:] = self.power
+
+    def active(self):
+        with self._lock:
+            return bool(np.any(self.power != self._target))
+
+    def tick(self, now):
+        """Advance every ramp to ``now``; returns the powers, or None if
+        nothing changed."""
+        with self._lock:
+            elapsed = now - self._t0
+            progress = np.ones_like(elapsed)
+            moving = self._duration > 0
+            progress[moving] = np.clip(elapsed[moving] / self._duration[moving], 0.0, 1.0)
+            if self.profile == self.S_CURVE:
+                progress = progress * progress * (3 - 2 * progress)
+            power = self._start + (self._target - self._start) * progress
+            if np.array_equal(power, self.power):
+                return None
+            self.power = power
+            self.commit(power.round().astype(int).tolist())
+        return power
+
+    def _idle(self):
+        return not self.active()
+
+    def _tick(self, now, dt):
+        self.tick(now)
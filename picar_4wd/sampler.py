@@ -0,0 +1,69 @@
+import threading
+import time
+import numpy as np
+from .periodic import Periodic
+
+
+class Sampler(Periodic):
+    """Reads an ``ADCGroup`` at a fixed rate into a ring buffer.
+
+    One thread does all the bus reads; consumers take the latest sample or
+    a window of recent ones from memory.  ``latest(max_age)`` falls back to
+    a direct read when the newest sample is older than ``max_age`` seconds,
+    for example while the thread is not running.
+    """
+
+    def __init__(self, group, rate=100, size=256):
+        super().__init__(rate)
+        self.group = group
+        self.size = size
+        self.times = np.zeros(size)
+        self.values = np.zeros((size, len(group)), dtype=np.uint16)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Read the group once, store it and return ``(timestamp, values)``."""
+        timestamp, values = self.group.read()
+        with self._lock:
+            i = self.count % self.size
+            self.times[i] = timestamp
+            self.values[i] = values
+            self.count += 1
+        return timestamp, values
+
+    def _tick(self, now, dt):
+        self.sample()
+
+    def latest(self, max_age=None):
+        """Newest ``(timestamp, values)``.
+
+        If there is none yet, or it is older than ``max_age`` seconds, the
+        group is read directly instead.
+        """
+        with self._lock:
+            if self.count:
+                i = (self.count - 1) % self.size
+                timestamp = self.times[i]
+                if max_age is None or time.monotonic() - timestamp <= max_age:
+                    return timestamp, self.values[i].copy()
+        return self.sample()
+
+    def window(self, num=None, seconds=None):
+        """Recent samples, oldest first, as ``(times, values)`` arrays.
+
+        ``num`` limits the number of samples, ``seconds`` their age; by
+        default the whole buffer is returned.
+        """
+        with self._lock:
+            available = min(self.count, self.size)
+            if num is not None:
+                available = min(available, num)
+            index = np.arange(self.count - available, self.count) % self.size
+            times = self.times[index]
+            values = self.values[index]
+        if seconds is not None:
+            keep = times >= time.monotonic() - seconds
+            times = times[keep]
+            values = values[keep]
+        return times, values
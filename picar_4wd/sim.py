@@ -0,0 +1,277 @@
+"""Simulated PiCar-4WD HAT for running off the robot.
+
+Emulates the SunFounder MCU register map behind an ``SMBus`` compatible
+class, and the Raspberry Pi GPIO pins behind a ``GPIO`` object with the
+``RPi.GPIO`` calls this package uses.  Select it with
+``PICAR_4WD_BACKEND=sim``, see ``backend.py``.  Everything shares the
+module level ``hat``, which tests and benchmarks can inspect and steer:
+
+    hat.adc[7] = 300            # value of A7
+    hat.latency = 0.0002        # seconds added to every bus transaction
+    hat.fail_rate = 0.01        # chance of an I/O error per transaction
+    hat.fail_next(3)            # the next 3 transactions fail
+    hat.offline = True          # the MCU stops answering (brown-out)
+    hat.set_pulse_rate(25, 40)  # 40 encoder edges per second on GPIO25
+"""
+import errno
+import random
+import threading
+import time
+
+REG_CHN = 0x20
+REG_PSC = 0x40
+REG_ARR = 0x44
+SOFT_RESET_PIN = 21
+
+
+class SimHAT(object):
+    """Register level model of the HAT MCU and the Pi's GPIO pins."""
+
+    def __init__(self, address=0x14):
+        self.address = address
+        self.latency = 0.0
+        self.fail_rate = 0.0
+        self.offline = False
+        self.adc = [0] * 8
+        self.transactions = 0
+        self.failures = 0
+        self.resets = 0
+        self.lock = threading.RLock()
+        self._fail_next = 0
+        self._random = random.Random(0)
+        self._pins = {}
+        self._modes = {}
+        self._rates = {}
+        self._callbacks = {}
+        self._edge_threads = {}
+        self.reset()
+
+    def reset(self):
+        """Power-on state of the MCU registers."""
+        with self.lock:
+            self.regs = {}
+            self._adc_select = None
+            self._adc_bytes = []
+
+    def fail_next(self, count=1):
+        self._fail_next += count
+
+    def seed(self, value):
+        self._random.seed(value)
+
+    # I2C side
+
+    def _transaction(self, addr):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.transactions += 1
+            fail = False
+            if self._fail_next > 0:
+                self._fail_next -= 1
+                fail = True
+            elif self.fail_rate and self._random.random() < self.fail_rate:
+                fail = True
+            if fail or self.offline or addr != self.address or self._pins.get(SOFT_RESET_PIN) == 0:
+                self.failures += 1
+                raise OSError(errno.EREMOTEIO, "Remote I/O error")
+
+    def write(self, addr, data):
+        """Bytes written to ``addr`` in one transaction."""
+        self._transaction(addr)
+        with self.lock:
+            reg = data[0]
+            if len(data) == 3 and reg & 0xF0 == 0x10 and data[1] == 0 and data[2] == 0:
+                # ADC channel select: [0x10 | (7 - chn), 0, 0]
+                self._adc_select = 7 - (reg & 0x0F)
+                value = int(self.adc[self._adc_select]) & 0xFFFF
+                self._adc_bytes = [value >> 8, value & 0xFF]
+                return
+            # 16 bit registers, high byte first, auto incrementing
+            for i in range(1, len(data) - 1, 2):
+                self.regs[reg] = (data[i] << 8) | data[i + 1]
+                reg += 1
+
+    def read(self, addr, num):
+        self._transaction(addr)
+        with self.lock:
+            result = []
+            for _ in range(num):
+                result.append(self._adc_bytes.pop(0) if self._adc_bytes else 0)
+            return result
+
+    def pwm(self, channel):
+        """(pulse width, prescaler, arr) registers of a PWM channel."""
+        timer = int(channel / 4)
+        with self.lock:
+            return (
+                self.regs.get(REG_CHN + channel, 0),
+                self.regs.get(REG_PSC + timer, 0),
+                self.regs.get(REG_ARR + timer, 0),
+            )
+
+    # GPIO side
+
+    def output(self, pin, value):
+        value = 1 if value else 0
+        with self.lock:
+            old = self._pins.get(pin, 1 if pin == SOFT_RESET_PIN else 0)
+            self._pins[pin] = value
+        if pin == SOFT_RESET_PIN and old == 1 and value == 0:
+            self.resets += 1
+            self.reset()
+
+    def input(self, pin):
+        rate = self._rates.get(pin)
+        if rate:
+            # Square wave with ``rate`` edges per second.
+            return int(time.monotonic() * rate) % 2
+        return self._pins.get(pin, 0)
+
+    def set_pulse_rate(self, pin, rate):
+        """Drive ``pin`` as an encoder output with ``rate`` edges per second."""
+        self._rates[pin] = rate
+
+    def add_callback(self, pin, edge, callback):
+        self._callbacks.setdefault(pin, []).append((edge, callback))
+        if pin not in self._edge_threads:
+            thread = threading.Thread(target=self._edge_loop, args=(pin,), daemon=True)
+            self._edge_threads[pin] = thread
+            thread.start()
+
+    def remove_callbacks(self, pin):
+        self._callbacks.pop(pin, None)
+        self._edge_threads.pop(pin, None)
+
+    def _edge_loop(self, pin):
+        level = self.input(pin)
+        while self._edge_threads.get(pin) is threading.current_thread():
+            rate = self._rates.get(pin)
+            if not rate:
+                time.sleep(0.01)
+                continue
+            now = time.monotonic()
+            time.sleep(max(0.0, (int(now * rate) + 1) / rate - now))
+            new = self.input(pin)
+            if new == level:
+                continue
+            level = new
+            edge = GPIO.RISING if new else GPIO.FALLING
+            for wanted, callback in list(self._callbacks.get(pin, [])):
+                if wanted in (edge, GPIO.BOTH):
+                    callback(pin)
+
+
+hat = SimHAT()
+
+
+class SMBus(object):
+    """``smbus2.SMBus`` compatible front end of ``hat``."""
+
+    def __init__(self, bus=None):
+        self.bus = bus
+
+    def close(self):
+        pass
+
+    def write_byte(self, addr, data):
+        hat.write(addr, [data])
+
+    def write_byte_data(self, addr, reg, data):
+        hat.write(addr, [reg, data])
+
+    def write_word_data(self, addr, reg, data):
+        hat.write(addr, [reg, data & 0xFF, data >> 8])
+
+    def write_i2c_block_data(self, addr, reg, data):
+        hat.write(addr, [reg] + list(data))
+
+    def read_byte(self, addr):
+        return hat.read(addr, 1)[0]
+
+    def read_byte_data(self, addr, reg):
+        hat.write(addr, [reg])
+        return hat.read(addr, 1)[0]
+
+    def read_word_data(self, addr, reg):
+        hat.write(addr, [reg])
+        data = hat.read(addr, 2)
+        return data[0] | (data[1] << 8)
+
+    def read_i2c_block_data(self, addr, reg, num):
+        hat.write(addr, [reg])
+        return hat.read(addr, num)
+
+
+class _GPIO(object):
+    """The part of ``RPi.GPIO`` this package uses, backed by ``hat``."""
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        hat._modes[pin] = mode
+        if initial is not None:
+            hat.output(pin, initial)
+
+    def output(self, pin, value):
+        if isinstance(pin, (list, tuple)):
+            if not isinstance(value, (list, tuple)):
+                value = [value] * len(pin)
+            for p, v in zip(pin, value):
+                hat.output(p, v)
+        else:
+            hat.output(pin, value)
+
+    def input(self, pin):
+        return hat.input(pin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        if callback is not None:
+            hat.add_callback(pin, edge, callback)
+
+    def add_event_callback(self, pin, callback):
+        hat.add_callback(pin, self.BOTH, callback)
+
+    def remove_event_detect(self, pin):
+        hat.remove_callbacks(pin)
+
+    def cleanup(self, *pins):
+        pass
+
+
+GPIO = _GPIO()
+
+
+def test():
+    import os
+    os.environ["PICAR_4WD_BACKEND"] = "sim"
+    import picar_4wd as fc
+    # Use the package's copy of this module, not the one run as __main__.
+    from picar_4wd.sim import hat
+    hat.adc[5:8] = [100, 200, 300]
+    print(fc.get_grayscale_list())
+    start = time.monotonic()
+    for i in range(1000):
+        fc.forward(i % 100)
+    print("forward: %.1f us/call" % ((time.monotonic() - start) * 1000))
+    print(fc.PWM.write_stats())
+    print("bus transactions: %s" % hat.transactions)
+
+if __name__ == '__main__':
+    test()
@@ -1,43 +1,154 @@
-import RPi.GPIO as GPIO
+from .backend import GPIO
 import time, math
 import threading
+import numpy as np
+from .pin import Pin
+from .periodic import Periodic
 from . import *
 
 class Speed():
-    def __init__(self, pin):
+    SLOTS = 20      # encoder disc slots per wheel revolution
+    RADIUS = 3.3    # wheel radius in cm
+    TIMEOUT = 1.0   # seconds without an edge before the wheel counts as stopped
+    BUFFER = 128    # edge timestamps kept
+    WINDOW = 0.25   # seconds of edges the count based estimate uses
+    # With at least this many edges in WINDOW the speed is estimated from
+    # the edge count, below it from the last PERIOD_EDGES edge periods.
+    COUNT_EDGES = 10
+    PERIOD_EDGES = 2
+
+    def __init__(self, pin, service=None, slots=None, radius=None):
         self.speed_counter = 0
         self.speed = 0
+        self.acceleration = 0
         self.last_time = 0
         self.pin = pin
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-        self.timer_flag = True
-        self.timer = threading.Thread(target=self.fun_timer, name="Thread1")
+        self.service = service if service is not None else encoders
+        if slots is not None:
+            self.SLOTS = slots
+        if radius is not None:
+            self.RADIUS = radius
+        self._pin = Pin(pin, Pin.IN, Pin.PULL_DOWN)
+        self._edges = np.zeros(self.BUFFER)
+        self._update_time = None
 
     def start(self):
-        self.timer.start()
+        if self in self.service.encoders:
+            return
+        self._pin.irq(self._on_edge, Pin.IRQ_RISING_FALLING)
+        self.service.add(self)
         # print('speed start')
 
-    def print_result(self, s):
-        print("Rising: {}; Falling: {}; High Level: {}; Low Level: {}".format(s.count("01"), s.count("10"), s.count("1"), s.count("0")))
+    def _on_edge(self, channel):
+        # Runs on the GPIO callback thread: record the edge and nothing else.
+        now = time.monotonic()
+        self._edges[self.speed_counter % self.BUFFER] = now
+        self.last_time = now
+        self.speed_counter += 1
+
+    def edge_rate(self, now):
+        """Encoder edges per second at ``now``.
+
+        Fast wheels are measured by counting the edges in the last
+        ``WINDOW`` seconds, which averages out callback jitter.  Slow ones
+        give too few edges for that, so the last few edge periods are used
+        instead, which react without waiting for a window to fill.  Either
+        way the rate is capped by the time since the last edge, so it falls
+        off smoothly when the wheel stops.
+        """
+        count = self.speed_counter
+        available = min(count, self.BUFFER)
+        if available < 2:
+            return 0.0
+        stamps = self._edges[np.arange(count - available, count) % self.BUFFER]
+        idle = now - stamps[-1]
+        if idle > self.TIMEOUT:
+            return 0.0
+        recent = np.count_nonzero(stamps >= now - self.WINDOW)
+        if recent >= self.COUNT_EDGES:
+            # Edges counted over the span they cover inside the window.
+            rate = (recent - 1) / (stamps[-1] - stamps[-recent])
+        else:
+            periods = min(self.PERIOD_EDGES, available - 1)
+            span = stamps[-1] - stamps[-1 - periods]
+            rate = periods / span if span > 0 else 0.0
+        if idle > 0:
+            rate = min(rate, 1.0 / idle)
+        return rate
 
-    def fun_timer(self):
-        while self.timer_flag:
-            l = ""
-            for _ in range(100):
-                l += str(GPIO.input(self.pin))
-                time.sleep(0.001)
-            # self.print_result(l)
-            count = (l.count("01") + l.count("10")) / 2
-            rps = count / 20.0 * 10
-            self.speed = round(2 * math.pi * 3.3 * rps, 2)
+    def update(self, now):
+        """Recompute ``speed`` (cm/s) and ``acceleration`` (cm/s^2); called
+        by the encoder service every tick."""
+        rps = float(self.edge_rate(now)) / (2.0 * self.SLOTS)
+        speed = 2 * math.pi * self.RADIUS * rps
+        if self._update_time is not None and now > self._update_time:
+            self.acceleration = round((speed - self.speed) / (now - self._update_time), 2)
+        self._update_time = now
+        self.speed = round(speed, 2)
 
     def __call__(self):
         return self.speed
 
     def deinit(self):
-        self.timer_flag = False
-        self.timer.join()
+        self.service.remove(self)
+        GPIO.remove_event_detect(self.pin)
+        # Nothing updates the estimate any more; don't leave the wheel
+        # looking like it is still turning.
+        self.speed = 0
+        self.acceleration = 0
+
+
+class EncoderService(Periodic):
+    """Updates every started ``Speed`` from one thread.
+
+    Edges are counted by GPIO callbacks, so the only periodic work is one
+    tick at ``rate`` for all wheels together.  The thread starts with the
+    first encoder and stops after the last one is removed.
+    """
+
+    def __init__(self, update_rate=10):
+        super().__init__(update_rate)
+        self.encoders = []
+        self._lock = threading.Lock()
+
+    def add(self, speed):
+        with self._lock:
+            if speed not in self.encoders:
+                self.encoders.append(speed)
+        self.start()
+
+    def remove(self, speed):
+        with self._lock:
+            if speed in self.encoders:
+                self.encoders.remove(speed)
+            empty = not self.encoders
+        if empty:
+            self.stop()
+            self.join()
+
+    def speeds(self):
+        """Speed of each encoder in cm/s, in the order they were started."""
+        with self._lock:
+            return [speed.speed for speed in self.encoders]
+
+    def accelerations(self):
+        """Acceleration of each encoder in cm/s^2, in the same order."""
+        with self._lock:
+            return [speed.acceleration for speed in self.encoders]
+
+    def deinit(self):
+        for speed in list(self.encoders):
+            speed.deinit()
+        super().deinit()
+
+    def _tick(self, now, dt):
+        with self._lock:
+            encoders = list(self.encoders)
+        for speed in encoders:
+            speed.update(now)
+
+
+encoders = EncoderService()
 
 
 def test1():
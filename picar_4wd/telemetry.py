@@ -0,0 +1,147 @@
+"""System telemetry read straight from /proc, /sys and statvfs.
+
+``Telemetry`` caches each metric for its own time-to-live, so any number
+of callers (one per websocket client, say) share the same readings and
+nothing is forked.  ``pi_read()`` in utils serves the shared ``telemetry``
+instance.
+"""
+import math
+import os
+import threading
+import time
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+
+def read_cpu_temperature():
+    with open(THERMAL_ZONE) as f:
+        return round(int(f.read()) / 1000, 2)
+
+
+def read_cpu_times():
+    """(idle, total) jiffies of all CPUs from /proc/stat."""
+    with open("/proc/stat") as f:
+        fields = [int(x) for x in f.readline().split()[1:]]
+    # user nice system idle iowait irq softirq steal; guest time is already
+    # counted in user and nice.
+    fields = fields[:8]
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    return idle, sum(fields)
+
+
+def read_meminfo():
+    info = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            name, value = line.split(":", 1)
+            info[name] = int(value.split()[0])
+    return info
+
+
+def read_ram_info():
+    """[total, used, free] like the Mem line of ``free``, in thousands of KiB."""
+    info = read_meminfo()
+    total = info["MemTotal"]
+    free = info["MemFree"]
+    if "MemAvailable" in info:
+        # procps 4 computes used this way
+        used = total - info["MemAvailable"]
+    else:
+        cache = info.get("Cached", 0) + info.get("SReclaimable", 0)
+        used = total - free - info.get("Buffers", 0) - cache
+    return [round(x / 1000, 1) for x in (total, used, free)]
+
+
+def human_size(num):
+    """Size in bytes formatted like ``df -h``, e.g. '5.2G' or '29G'."""
+    for unit in "BKMGTPE":
+        if num < 1024 or unit == "E":
+            break
+        num /= 1024.0
+    if unit == "B":
+        return "%d" % num
+    if num < 10:
+        return "%.1f%s" % (math.ceil(num * 10) / 10, unit)
+    return "%d%s" % (math.ceil(num), unit)
+
+
+def read_disk_space(path="/"):
+    """[size, used, available, use%] like ``df -h``."""
+    st = os.statvfs(path)
+    size = st.f_blocks * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    avail = st.f_bavail * st.f_frsize
+    percent = math.ceil(used * 100.0 / (used + avail)) if used + avail else 0
+    return [human_size(size), human_size(used), human_size(avail), "%d%%" % percent]
+
+
+class Telemetry(object):
+    """Shared, per metric cached system readings."""
+    # Seconds each metric is reused for.
+    TTL = {
+        "cpu_temperature": 2.0,
+        "gpu_temperature": 2.0,
+        "cpu_usage": 1.0,
+        "disk": 30.0,
+        "ram": 2.0,
+        "battery": 1.0,
+    }
+
+    def __init__(self, ttl=None):
+        self.ttl = dict(self.TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self._cache = {}
+        self._cpu_times = None
+        # One lock per metric: a slow read (the battery goes over I2C with
+        # retries) only holds up callers of that same metric.
+        self._locks = {name: threading.Lock() for name in self.ttl}
+
+    def cpu_usage(self):
+        """Busy percentage of all CPUs since the previous call, as a string
+        like ``mpstat`` gave it."""
+        idle, total = read_cpu_times()
+        if self._cpu_times is None:
+            last_idle, last_total = 0, 0
+        else:
+            last_idle, last_total = self._cpu_times
+        self._cpu_times = (idle, total)
+        if total == last_total:
+            return "0.0"
+        return str(round(100 - (idle - last_idle) * 100.0 / (total - last_total), 2))
+
+    def _read(self, name):
+        if name in ("cpu_temperature", "gpu_temperature"):
+            # The Pi has one SoC sensor; vcgencmd measure_temp reads the same.
+            return read_cpu_temperature()
+        if name == "cpu_usage":
+            return self.cpu_usage()
+        if name == "disk":
+            return read_disk_space()
+        if name == "ram":
+            return read_ram_info()
+        if name == "battery":
+            from .utils import power_read
+            return power_read(self.ttl["battery"])
+        raise KeyError(name)
+
+    def get(self, name):
+        """Value of one metric, read again only once its TTL has passed.
+        None if it cannot be read on this machine."""
+        with self._locks[name]:
+            now = time.monotonic()
+            cached = self._cache.get(name)
+            if cached is not None and now - cached[1] < self.ttl[name]:
+                return cached[0]
+            try:
+                value = self._read(name)
+            except (OSError, ValueError, KeyError, IndexError):
+                value = None
+            self._cache[name] = (value, now)
+            return value
+
+    def snapshot(self):
+        return {name: self.get(name) for name in self.TTL}
+
+
+telemetry = Telemetry()
@@ -0,0 +1,111 @@
+"""Optional I2C bus instrumentation.
+
+Each ``SharedBus`` owns a ``BusTrace``.  While it is disabled the only cost
+is one attribute check per bus call.  Enable it with ``I2C.enable_trace()``
+or by setting ``PICAR_4WD_TRACE=1`` before importing ``picar_4wd``, then
+read the counters with ``snapshot()``.
+"""
+from bisect import bisect_left
+from collections import deque
+import os
+import threading
+import time
+
+
+class BusTrace(object):
+    """Per device, register and caller counters for one I2C bus."""
+    # Upper bounds of the latency histogram buckets in seconds.  The last
+    # bucket counts everything slower.
+    BUCKETS = (0.00005, 0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05)
+    RECENT = 256
+
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get("PICAR_4WD_TRACE", "") not in ("", "0")
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._devices = {}
+            self._registers = {}
+            self._callers = {}
+            self._recent = deque(maxlen=self.RECENT)
+            self._since = time.monotonic()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def record(self, caller, op, addr, reg, nbytes, latency, ok):
+        """Count one bus primitive; called only while enabled."""
+        with self._lock:
+            dev = self._devices.get(addr)
+            if dev is None:
+                dev = self._devices[addr] = {
+                    "calls": 0, "errors": 0, "retries": 0, "bytes": 0,
+                    "time": 0.0, "max": 0.0,
+                    "histogram": [0] * (len(self.BUCKETS) + 1),
+                }
+            dev["calls"] += 1
+            dev["bytes"] += nbytes
+            dev["time"] += latency
+            if latency > dev["max"]:
+                dev["max"] = latency
+            dev["histogram"][bisect_left(self.BUCKETS, latency)] += 1
+            if not ok:
+                dev["errors"] += 1
+
+            key = (addr, reg)
+            stat = self._registers.get(key)
+            if stat is None:
+                stat = self._registers[key] = [0, 0]
+            stat[0] += 1
+            stat[1] += nbytes
+
+            stat = self._callers.get(caller)
+            if stat is None:
+                stat = self._callers[caller] = {"calls": 0, "bytes": 0, "time": 0.0, "retries": 0}
+            stat["calls"] += 1
+            stat["bytes"] += nbytes
+            stat["time"] += latency
+
+            self._recent.append((time.monotonic(), caller, op, addr, reg, nbytes, latency, ok))
+
+    def record_retry(self, caller, addr):
+        with self._lock:
+            dev = self._devices.get(addr)
+            if dev is not None:
+                dev["retries"] += 1
+            stat = self._callers.get(caller)
+            if stat is not None:
+                stat["retries"] += 1
+
+    def snapshot(self, recent=False):
+        """Copy of the counters.
+
+        ``devices`` and ``callers`` hold call, byte, time and retry counts,
+        devices also a latency histogram over ``buckets``.  ``registers`` maps
+        each device address to ``{register: [calls, bytes]}``, with ``None``
+        for calls that do not name a register.  With ``recent`` the last
+        ``RECENT`` calls are included as ``(time, caller, op, addr, reg,
+        bytes, latency, ok)`` tuples.
+        """
+        with self._lock:
+            registers = {}
+            for (addr, reg), stat in self._registers.items():
+                registers.setdefault(addr, {})[reg] = list(stat)
+            result = {
+                "enabled": self.enabled,
+                "elapsed": time.monotonic() - self._since,
+                "buckets": self.BUCKETS,
+                "devices": {
+                    addr: dict(dev, histogram=list(dev["histogram"]))
+                    for addr, dev in self._devices.items()
+                },
+                "registers": registers,
+                "callers": {caller: dict(stat) for caller, stat in self._callers.items()},
+            }
+            if recent:
+                result["recent"] = list(self._recent)
+            return result
@@ -1,13 +1,21 @@
 
 
-import subprocess
 import os
 import time
 
 # user_name = os.getlogin()
 # user_name = os.popen("echo ${SUDO_USER:-$(who -m | awk '{ print $1 }')}").readline().strip()
 # user_name = os.popen("getent passwd ${SUDO_UID:-$(id -u)} | cut -d: -f 6").readline().strip().split('/')[2]
-user_name = os.popen("ls /home | head -n 1").readline().strip()
+def home_user():
+    """First user directory in /home, as ``ls /home | head -n 1`` gave it,
+    without starting a shell."""
+    try:
+        names = sorted(name for name in os.listdir("/home") if not name.startswith("."))
+    except OSError:
+        return ""
+    return names[0] if names else ""
+
+user_name = home_user()
 
 
 def soft_reset():
@@ -18,70 +26,66 @@ def soft_reset():
     time.sleep(0.01)
     soft_reset_pin.high()
     time.sleep(0.01)
-    PWM.reinit_all()
+    PWM.restore()
 
 def mapping(x,min_val,max_val,aim_min,aim_max):
     x = aim_min + abs((x - min_val) / (max_val- min_val) * (aim_max-aim_min))
     return x
 
 def cpu_temperature():          # cpu_temperature
-    raw_cpu_temperature = subprocess.getoutput("cat /sys/class/thermal/thermal_zone0/temp")
-    cpu_temperature = round(float(raw_cpu_temperature)/1000,2)               # convert unit
-    #cpu_temperature = 'Cpu temperature : ' + str(cpu_temperature)
-    return cpu_temperature
+    from .telemetry import read_cpu_temperature
+    return read_cpu_temperature()
 
 def gpu_temperature():          # gpu_temperature(
-    raw_gpu_temperature = subprocess.getoutput( 'vcgencmd measure_temp' )
-    gpu_temperature = round(float(raw_gpu_temperature.replace( 'temp=', '' ).replace( '\'C', '' )), 2)
-    #gpu_temperature = 'Gpu temperature : ' + str(gpu_temperature)
-    return gpu_temperature
+    # Same SoC sensor that vcgencmd measure_temp reports.
+    from .telemetry import read_cpu_temperature
+    return read_cpu_temperature()
 
 def cpu_usage():                # cpu_usage
-    # result = str(os.popen("top -n1 | awk '/Cpu\(s\):/ {print($2)}'").readline().strip())
-    result = os.popen("mpstat").read().strip()
-    result = result.split('\n')[-1].split(' ')[-1]
-    result = round(100 - float(result), 2)
-    result = str(result)
-    # print(result)
-    return result
+    from .telemetry import telemetry
+    return telemetry.get("cpu_usage")
 
 def disk_space():               # disk_space
-    p = os.popen("df -h /")
-    i = 0
-    while 1:
-        i = i +1
-        line = p.readline()         
-        if i==2:
-            return line.split()[1:5]    
+    from .telemetry import read_disk_space
+    return read_disk_space()
 
 def ram_info():
-    p = os.popen('free')
-    i = 0
-    while 1:
-        i = i + 1
-        line = p.readline()
-        if i==2:
-            return list(map(lambda x:round(int(x) / 1000,1), line.split()[1:4]))   
+    from .telemetry import read_ram_info
+    return read_ram_info()
 
 def pi_read():
-    result = {
-        "cpu_temperature": cpu_temperature(), 
-        "gpu_temperature": gpu_temperature(),
-        "cpu_usage": cpu_usage(), 
-        "disk": disk_space(), 
-        "ram": ram_info(), 
-        "battery": power_read(), 
-    }
-    return result 
-
-def power_read():
-    from picar_4wd.adc import ADC
-    power_read_pin = ADC('A4')
-    power_val = power_read_pin.read()
+    """System and battery readings, served from the shared telemetry cache."""
+    from .telemetry import telemetry
+    return telemetry.snapshot()
+
+# Seconds power_read() reuses its last reading for.
+POWER_READ_INTERVAL = 1.0
+_power_cache = [None, 0.0]
+
+def power_read(max_age=None):
+    """Battery voltage.  The ADC is only read again once the last reading
+    is older than ``max_age`` seconds (POWER_READ_INTERVAL by default).
+    While the background sampler runs its A4 column is used instead of
+    another bus read."""
+    if max_age is None:
+        max_age = POWER_READ_INTERVAL
+    if _power_cache[0] is not None and time.monotonic() - _power_cache[1] < max_age:
+        return _power_cache[0]
+    import picar_4wd
+    if picar_4wd.sampler_running():
+        # Column 3 of the sampler is the battery, see picar_4wd.sensors
+        sensors = picar_4wd.sensors
+        power_val = int(sensors.latest(picar_4wd.SAMPLE_MAX_AGE / sensors.rate)[1][3])
+    else:
+        from picar_4wd.adc import ADC
+        power_read_pin = ADC.get('A4', caller="power_read")
+        power_val = power_read_pin.read()
     power_val = power_val / 4095.0 * 3.3
     # print(power_val)
     power_val = power_val * 3
     power_val = round(power_val, 2)
+    _power_cache[0] = power_val
+    _power_cache[1] = time.monotonic()
     return power_val
 
 def getIPs(ifaces=['wlan0', 'eth0']):
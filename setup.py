@@ -158,6 +158,7 @@ PIP_INSTALL_LIST = [
     'gpiozero',
     'smbus2',
     "websockets",
+    "numpy",
 ]
 
 def install():
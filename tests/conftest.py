@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Run everything against the simulated HAT in picar_4wd/sim.py.
+os.environ["PICAR_4WD_BACKEND"] = "sim"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
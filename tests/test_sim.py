@@ -0,0 +1,122 @@
+"""Hot paths checked against the simulated HAT, no Pi needed."""
+import time
+import pytest
+import picar_4wd as fc
+from picar_4wd.adc import ADC, ADCGroup
+from picar_4wd.i2c import SharedBus, BusUnavailableError
+from picar_4wd.pwm import PWM, solve_freq
+from picar_4wd.sim import hat
+
+PSC, ARR = solve_freq(PWM.CLOCK, 50)
+# PWM channel and direction GPIO of each motor
+LEFT_FRONT, RIGHT_FRONT, LEFT_REAR, RIGHT_REAR = (13, 23), (12, 24), (8, 13), (9, 20)
+
+
+def pulse(power):
+    """Pulse width register value Motor.frame gives ``power``."""
+    percent = int(abs(power) / 2) + 20 if power else 0
+    return int(percent / 100.0 * (ARR - 1))
+
+
+@pytest.fixture(autouse=True)
+def sim(monkeypatch):
+    monkeypatch.setattr(SharedBus, "BREAKER_COOLDOWN", 0.2)
+    yield hat
+    hat.offline = False
+    hat.fail_rate = 0.0
+    hat._fail_next = 0
+    bus = SharedBus._buses[1]
+    bus._failures = 0
+    bus._open_until = 0.0
+    fc.stop()
+
+
+def test_forward_sets_every_motor():
+    fc.forward(60)
+    for channel, dir_pin in (LEFT_FRONT, RIGHT_FRONT, LEFT_REAR, RIGHT_REAR):
+        assert hat.pwm(channel) == (pulse(60), PSC - 1, ARR - 1)
+        assert hat.input(dir_pin) == 0
+    fc.backward(30)
+    for channel, dir_pin in (LEFT_FRONT, RIGHT_FRONT, LEFT_REAR, RIGHT_REAR):
+        assert hat.pwm(channel)[0] == pulse(30)
+        assert hat.input(dir_pin) == 1
+
+
+def test_drive_mixes_throttle_and_steer():
+    fc.drive(50, 50)
+    assert hat.pwm(LEFT_FRONT[0])[0] == pulse(100)
+    assert hat.pwm(LEFT_REAR[0])[0] == pulse(100)
+    assert hat.pwm(RIGHT_FRONT[0])[0] == 0
+    assert hat.pwm(RIGHT_REAR[0])[0] == 0
+    # Past full power both sides scale down together
+    assert fc.arcade_mix(100, 50) == (100.0, pytest.approx(100 / 3))
+
+
+def test_adc_group_values():
+    hat.adc[5], hat.adc[6], hat.adc[7] = 100, 2000, 4095
+    assert fc.get_grayscale_list() == [100, 2000, 4095]
+    timestamp, values = ADCGroup([ADC.get('A7'), ADC.get('A5')]).read()
+    assert values.tolist() == [4095, 100]
+    assert timestamp <= time.monotonic()
+
+
+def test_transient_failures_recover():
+    adc = ADC.get('A4', caller="test")
+    hat.adc[4] = 1234
+    hat.fail_next(2)
+    assert adc.read() == 1234
+    hat.fail_next(3)
+    assert adc.read() == 1234
+    stats = adc.recovery_stats()
+    assert stats["retry"]["count"] >= 1
+    assert stats["reopen"]["count"] >= 1
+    assert not adc.breaker_state()["open"]
+
+
+def test_breaker_fails_fast_and_closes():
+    adc = ADC.get('A4', caller="test")
+    hat.adc[4] = 42
+    hat.offline = True
+    for _ in range(SharedBus.BREAKER_THRESHOLD):
+        with pytest.raises(OSError):
+            adc.read()
+    assert adc.breaker_state()["open"]
+    transactions = hat.transactions
+    with pytest.raises(BusUnavailableError):
+        adc.read()
+    assert hat.transactions == transactions
+    hat.offline = False
+    time.sleep(SharedBus.BREAKER_COOLDOWN + 0.05)
+    assert adc.read() == 42
+    assert not adc.breaker_state()["open"]
+
+
+def test_pwm_restored_after_reset_while_offline():
+    fc.forward(50)
+    hat.offline = True
+    fc.forward(60)      # fails, the MCU is reset but cannot be restored
+    hat.offline = False
+    time.sleep(SharedBus.BREAKER_COOLDOWN + 0.05)
+    fc.forward(70)
+    for channel, _ in (LEFT_FRONT, RIGHT_FRONT, LEFT_REAR, RIGHT_REAR):
+        assert hat.pwm(channel) == (pulse(70), PSC - 1, ARR - 1)
+
+
+def test_stop_cancels_ramp():
+    fc.ramp_frame(100, 100, 100, 100, accel=200)
+    time.sleep(0.1)
+    fc.stop()
+    time.sleep(0.1)
+    assert not fc.ramp_scheduler.active()
+    for channel, _ in (LEFT_FRONT, RIGHT_FRONT, LEFT_REAR, RIGHT_REAR):
+        assert hat.pwm(channel)[0] == 0
+
+
+def test_stop_ends_speed_control():
+    fc.set_speed(30)
+    time.sleep(0.1)
+    fc.stop()
+    time.sleep(0.1)
+    assert not fc.speed_controller.running
+    for channel, _ in (LEFT_FRONT, RIGHT_FRONT, LEFT_REAR, RIGHT_REAR):
+        assert hat.pwm(channel)[0] == 0